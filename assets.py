@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+AssetRegistry: Internal module for use in the FionaBot discord bot's reaction images.
+Keeps static images in memory and reuses Discord's copy once one has been uploaded.
+"""
+import io
+import os
+import sys
+import time
+from discord import Embed, File
+
+
+class AssetRegistry:
+    def __init__(self, paths, url_ttl=12 * 60 * 60):
+        """
+        Reads every asset into memory up front. A missing file is reported and skipped, then
+        read again when it is next sent, so only that asset's trigger fails. After an asset is
+        uploaded the first time, later sends embed the attachment's CDN URL instead of uploading
+        the bytes again. Discord's attachment URLs are signed and expire, so a URL is only reused
+        for url_ttl seconds.
+
+        :param paths: Iterable of file paths to preload
+        :param url_ttl: Seconds to reuse an uploaded attachment's URL for
+        """
+        self.url_ttl = url_ttl
+        self.data = {}
+        self.urls = {}
+        for path in paths:
+            try:
+                self.load(path)
+            except OSError as e:
+                sys.stderr.write('Could not load asset %s: %s\n' % (path, e))
+
+    def load(self, path):
+        """
+        :param path: Path of an asset
+        :return: The asset's bytes, read from disk if they aren't in memory yet
+        """
+        data = self.data.get(path)
+        if data is None:
+            with open(path, 'rb') as f:
+                data = self.data[path] = f.read()
+        return data
+
+    def file(self, path):
+        """
+        :param path: Path of an asset
+        :return: discord.File reading from the in-memory copy
+        """
+        return File(io.BytesIO(self.load(path)), filename=os.path.basename(path))
+
+    async def send(self, channel, content, path):
+        """
+        Sends an asset, uploading it only if there isn't a recent upload to point at.
+
+        :param channel: Channel to send to
+        :param content: Message text
+        :param path: Path of an asset
+        :return: The sent message
+        """
+        cached = self.urls.get(path)
+        if cached is not None and time.monotonic() - cached[1] < self.url_ttl:
+            embed = Embed()
+            embed.set_image(url=cached[0])
+            return await channel.send(content, embed=embed)
+
+        message = await channel.send(content, file=self.file(path))
+        if message.attachments:
+            self.urls[path] = (message.attachments[0].url, time.monotonic())
+        return message
@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+BoardRenderer: Internal module for use in the FionaBot discord bot's chess functions.
+Draws board images by pasting pre-rasterized sprites instead of rasterizing an SVG per move.
+"""
+import io
+import chess
+import chess.svg
+import cairosvg
+from PIL import Image
+
+CHECK_SVG = '<svg xmlns="http://www.w3.org/2000/svg" width="%(size)s" height="%(size)s"><defs>' \
+            '<radialGradient id="check_gradient" r="0.5">' \
+            '<stop offset="0%%" stop-color="#ff0000" stop-opacity="1.0" />' \
+            '<stop offset="50%%" stop-color="#e70000" stop-opacity="1.0" />' \
+            '<stop offset="100%%" stop-color="#9e0000" stop-opacity="0.0" />' \
+            '</radialGradient></defs>' \
+            '<rect width="%(size)s" height="%(size)s" fill="url(#check_gradient)" /></svg>'
+
+LASTMOVE_COLORS = {True: '#cdd16a', False: '#aaa23b'}  # Keyed by whether the square is light
+
+
+def rasterize(svg):
+    return Image.open(io.BytesIO(cairosvg.svg2png(bytestring=svg.encode('utf-8')))).convert('RGBA')
+
+
+class BoardRenderer:
+    def __init__(self, style="text {fill: white;}", lastmove_colors=None):
+        """
+        Renders boards in the same look as chess.svg.board. The empty board with its coordinates
+        is rasterized once per orientation and each piece once, the first time they are needed.
+        After that a frame is just pasting squares.
+
+        :param style: CSS passed on to chess.svg.board for the background
+        :param lastmove_colors: Dict of square lightness (True for light) to the last move highlight colour
+        """
+        self.style = style
+        self.lastmove_colors = lastmove_colors or LASTMOVE_COLORS
+        self.square_size = chess.svg.SQUARE_SIZE
+        self.backgrounds = {}
+        self.sprites = {}
+        self.check = None
+
+    def background(self, orientation):
+        image = self.backgrounds.get(orientation)
+        if image is None:
+            image = rasterize(chess.svg.board(chess.BaseBoard.empty(), flipped=not orientation, style=self.style))
+            self.backgrounds[orientation] = image
+        return image
+
+    def sprite(self, piece):
+        image = self.sprites.get(piece)
+        if image is None:
+            image = rasterize(chess.svg.piece(piece))
+            self.sprites[piece] = image
+        return image
+
+    def check_overlay(self):
+        if self.check is None:
+            self.check = rasterize(CHECK_SVG % {'size': self.square_size})
+        return self.check
+
+    def offset(self, orientation):
+        return (self.background(orientation).width - 8 * self.square_size) // 2
+
+    def square_origin(self, square, orientation):
+        """
+        :param square: Square to locate
+        :param orientation: Colour at the bottom of the board
+        :return: (x, y) of the square's top left corner in the image
+        """
+        offset = self.offset(orientation)
+        file_index = chess.square_file(square)
+        rank_index = chess.square_rank(square)
+        x = (file_index if orientation else 7 - file_index) * self.square_size + offset
+        y = (7 - rank_index if orientation else rank_index) * self.square_size + offset
+        return x, y
+
+    def draw_square(self, image, square, orientation, piece=None, lastmove=False, check=False, background=None):
+        """
+        Redraws a single square of a frame.
+
+        :param image: RGBA frame to draw on
+        :param square: Square to draw
+        :param orientation: Colour at the bottom of the board
+        :param piece: Piece standing on the square, if any
+        :param lastmove: Whether the square is part of the last move
+        :param check: Whether the square holds a king in check
+        :param background: Background to restore the square from, defaults to the empty board
+        :return:
+        """
+        x, y = self.square_origin(square, orientation)
+        size = self.square_size
+        if lastmove:
+            image.paste(self.lastmove_colors[bool(chess.BB_LIGHT_SQUARES & chess.BB_SQUARES[square])],
+                        (x, y, x + size, y + size))
+        else:
+            source = background if background is not None else self.background(orientation)
+            image.paste(source.crop((x, y, x + size, y + size)), (x, y))
+        if check:
+            image.alpha_composite(self.check_overlay(), (x, y))
+        if piece is not None:
+            image.alpha_composite(self.sprite(piece), (x, y))
+
+    def render_image(self, board, orientation, lastmove=None, check=None):
+        """
+        :param board: Board to draw
+        :param orientation: Colour at the bottom of the board
+        :param lastmove: Move to highlight
+        :param check: Square of a king in check to highlight
+        :return: RGBA PIL image
+        """
+        image = self.background(orientation).copy()
+        highlighted = (lastmove.from_square, lastmove.to_square) if lastmove else ()
+        for square in highlighted:
+            self.draw_square(image, square, orientation, lastmove=True)
+        if check is not None:
+            self.draw_square(image, check, orientation, lastmove=check in highlighted, check=True)
+        for square, piece in board.piece_map().items():
+            x, y = self.square_origin(square, orientation)
+            image.alpha_composite(self.sprite(piece), (x, y))
+        return image
+
+    def render(self, board, orientation):
+        """
+        Renders a game's board with its last move and check highlighted.
+
+        :param board: chess.Board to draw
+        :param orientation: Colour at the bottom of the board
+        :return: PNG bytes
+        """
+        lastmove = board.peek() if board.move_stack else None
+        check = board.king(board.turn) if board.is_check() else None
+        image = self.render_image(board, orientation, lastmove, check)
+        output = io.BytesIO()
+        image.convert('RGB').save(output, 'PNG', compress_level=1)
+        return output.getvalue()
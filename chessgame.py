@@ -4,28 +4,55 @@
 """
 ChessGame: Internal module for use in the FionaBot discord bot's chess functions.
 """
+import asyncio
 import chess
 import chess.engine
 import chess.pgn
-import chess.svg
-import cairosvg
-import os
+import boardrender
 import worstfish
 import datetime
 
+default_renderer = boardrender.BoardRenderer()
+
+
 class InvalidMoveException(Exception):
     def __init__(self, *args, **kwargs):
         Exception.__init__(self, *args, **kwargs)
 
 
 class ChessGame:
-    def __init__(self, difficulty=True):
-        self.engine = chess.engine.SimpleEngine.popen_uci("stockfish_20011801_x64_modern.exe" if os.name == 'nt' else
-                                                          './stockfish_20011801_x64_modern')
+    def __init__(self, difficulty=True, engines=None, limit=None, worstfish_options=None, eval_cache=None,
+                 cache_depth=20, renderer=None, book=None, tablebase=None, ponder=False):
+        """
+        :param difficulty: True to play the best moves, False to play the worst ones
+        :param engines: enginepool.EnginePool to lease engines from for the bot's moves
+        :param limit: chess.engine.Limit for the bot's searches
+        :param worstfish_options: Dict of keyword arguments for worstfish.WorstFish in easy mode
+        :param eval_cache: evalcache.EvalCache shared between games
+        :param cache_depth: Minimum depth of a cached evaluation to play its move instead of searching
+        :param renderer: boardrender.BoardRenderer to draw the board with
+        :param book: openingbook.OpeningBook to play the first moves from before asking the engine
+        :param tablebase: tablebase.Tablebase to play endgame moves from before asking the engine
+        :param ponder: Search the player's predicted reply while waiting for their move
+        """
+        self.engines = engines
+        self.limit = limit if limit is not None else chess.engine.Limit()
+        self.eval_cache = eval_cache
+        self.cache_depth = cache_depth
+        self.renderer = renderer if renderer is not None else default_renderer
+        self.book = book
+        self.tablebase = tablebase
+        self.ponder = ponder
+        self.ponder_move = None
+        self.ponder_board = None
+        self.ponder_task = None
+        self.ponder_analysis = None
+        self.ponder_stopped = False
         self.board = chess.Board()
         self.difficulty = difficulty
         if not self.difficulty:
-            self.worstfish = worstfish.WorstFish(self.engine)
+            self.worstfish = worstfish.WorstFish(self.engines, cache=eval_cache, tablebase=tablebase,
+                                                 **(worstfish_options or {}))
 
     def player_move(self, movestr):
         try:
@@ -37,12 +64,137 @@ class ChessGame:
         else:
             raise InvalidMoveException(self.print_possible_errors(self.move))
 
-    def ai_move(self):
+    async def ai_move(self):
+        pondered = await self.finish_pondering()
+        self.ponder_move = None
+        if pondered is not None:
+            self.play_searched(pondered['pv'][0], pondered)
+            return
+
+        if self.book is not None:
+            move = self.book.choose(self.board)
+            if move is not None:
+                self.board.push(move)
+                return
+
         if self.difficulty:
-            response = self.engine.play(self.board, chess.engine.Limit())
-            self.board.push(response.move)
+            if self.tablebase is not None and self.tablebase.covers(self.board):
+                ranked = self.tablebase.rank_moves(self.board)
+                if ranked:
+                    self.board.push(ranked[0])
+                    return
+
+            if self.eval_cache is not None:
+                cached = self.eval_cache.get(self.board, self.cache_depth)
+                if cached is not None and cached.move in self.board.legal_moves:
+                    self.board.push(cached.move)
+                    return
+
+            async with self.engines.lease() as engine:
+                response = await engine.play(self.board, self.limit, game=self,
+                                             info=chess.engine.INFO_SCORE | chess.engine.INFO_PV)
+            self.play_searched(response.move, response.info)
         else:
-            self.board.push(self.worstfish.get_move(self.board))
+            self.board.push(await self.worstfish.get_move(self.board))
+
+    def play_searched(self, move, info):
+        """
+        Plays a move found by a search, caching its evaluation and remembering the predicted reply.
+
+        :param move: Move to play
+        :param info: Info dict of the search
+        :return:
+        """
+        if self.eval_cache is not None and 'score' in info and 'depth' in info:
+            self.eval_cache.put(self.board, info['score'], info['depth'], move)
+        pv = info.get('pv', [])
+        self.ponder_move = pv[1] if len(pv) > 1 and pv[0] == move else None
+        self.board.push(move)
+
+    def start_pondering(self):
+        """
+        Starts searching the position after the player's predicted reply, with the game's usual
+        limit. Only starts if an engine in the pool is free right away, so pondering never makes
+        another game's move wait.
+
+        :return:
+        """
+        if not self.ponder or self.ponder_move is None or self.ponder_task is not None:
+            return
+        if self.engines is None or not self.engines.available():
+            return
+        board = self.board.copy()
+        board.push(self.ponder_move)
+        if board.is_game_over() or (self.tablebase is not None and self.tablebase.covers(board)):
+            return
+        self.ponder_board = board
+        self.ponder_stopped = False
+        self.ponder_task = asyncio.ensure_future(self.search_ponder(board))
+        self.ponder_task.add_done_callback(self.ponder_done)
+
+    async def search_ponder(self, board):
+        async with self.engines.lease() as engine:
+            with await engine.analysis(board, self.limit, game=self,
+                                       info=chess.engine.INFO_SCORE | chess.engine.INFO_PV) as analysis:
+                self.ponder_analysis = analysis
+                # A miss may have come in while the search was still starting
+                if self.ponder_stopped:
+                    analysis.stop()
+                await analysis.wait()
+        return analysis.info
+
+    @staticmethod
+    def ponder_done(task):
+        # Retrieve the outcome so a search nobody awaits (after close) doesn't log an unretrieved error
+        if not task.cancelled():
+            task.exception()
+
+    def stop_pondering(self):
+        """
+        Stops the ponder search. The task is never cancelled, since that could interrupt the
+        engine mid-command; the search stops itself as soon as it has started.
+
+        :return:
+        """
+        if self.ponder_task is None:
+            return
+        self.ponder_stopped = True
+        if self.ponder_analysis is not None:
+            self.ponder_analysis.stop()
+
+    async def finish_pondering(self):
+        """
+        Ends pondering once the player has moved. If they played the predicted move the search
+        is left to finish within its limit, otherwise it is stopped.
+
+        :return: Info dict of the ponder search on a ponder hit, otherwise None
+        """
+        task = self.ponder_task
+        if task is None:
+            return None
+        hit = self.board == self.ponder_board
+        if not hit:
+            self.stop_pondering()
+        try:
+            info = await task
+        except (Exception, asyncio.CancelledError):
+            info = None
+        self.ponder_task = None
+        self.ponder_board = None
+        self.ponder_analysis = None
+        self.ponder_stopped = False
+        if hit and info and info.get('pv') and info['pv'][0] in self.board.legal_moves:
+            return info
+        return None
+
+    def close(self):
+        """
+        Releases anything the game holds. Engines are only leased per move, so that is just
+        stopping a ponder search, which hands its engine back when it ends.
+
+        :return:
+        """
+        self.stop_pondering()
 
     def generate_move_digest(self, name):
         self.move = self.board.pop()
@@ -139,9 +291,4 @@ class ChessGame:
         return str(self.pgn)
 
     def get_png(self, color):
-        try:
-            self.lastmove = self.board.peek()
-        except IndexError:
-            self.lastmove = None
-        self.svg = chess.svg.board(self.board, lastmove=self.lastmove, flipped=not color, style="text {fill: white;}")
-        return cairosvg.svg2png(bytestring=self.svg.encode('utf-8'))
+        return self.renderer.render(self.board, color)
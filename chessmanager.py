@@ -0,0 +1,483 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+ChessGameManager: Internal module for use in the FionaBot discord bot's chess functions.
+Keeps every game as a small record and only advances it when one of its players' messages arrives.
+"""
+import array
+import asyncio
+import collections
+import functools
+import io
+import itertools
+import re
+import time
+import traceback
+import chess
+import chessgame
+from discord import File
+
+UCI_REGEX = re.compile('([a-h][1-8]){2}(qrknb)?')
+
+BOT_NAME = 'FionaBot'
+
+
+def encode_move(move):
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(value):
+    return chess.Move(value & 63, value >> 6 & 63, value >> 12 or None)
+
+
+class GameRecord:
+    __slots__ = ('id', 'channel_id', 'white', 'black', 'white_name', 'black_name', 'easymode', 'moves',
+                 'deadline', 'timer', 'busy', 'expired')
+
+    def __init__(self, game_id, channel_id, white, black, white_name, black_name, easymode=False, moves=()):
+        """
+        Everything kept about a game between moves. Moves are packed into two bytes each.
+
+        :param game_id: ID of the game
+        :param channel_id: ID of the channel the game is played in
+        :param white: ID of the user playing white, None for the bot
+        :param black: ID of the user playing black, None for the bot
+        :param white_name: Display name of the white player
+        :param black_name: Display name of the black player
+        :param easymode: Whether the bot plays the worst moves
+        :param moves: Encoded moves played so far
+        """
+        self.id = game_id
+        self.channel_id = channel_id
+        self.white = white
+        self.black = black
+        self.white_name = white_name
+        self.black_name = black_name
+        self.easymode = easymode
+        self.moves = array.array('H', moves)
+        self.deadline = None
+        self.timer = None
+        self.busy = False
+        self.expired = False
+
+    def turn(self):
+        return chess.WHITE if len(self.moves) % 2 == 0 else chess.BLACK
+
+    def player(self, color):
+        return self.white if color == chess.WHITE else self.black
+
+    def name(self, color):
+        return self.white_name if color == chess.WHITE else self.black_name
+
+    def players(self):
+        return {user_id for user_id in (self.white, self.black) if user_id is not None}
+
+    def against_bot(self):
+        return self.white is None or self.black is None
+
+    def orientation(self):
+        """
+        :return: Colour to draw the board for, the human's in a game against the bot, otherwise the side to move
+        """
+        if self.against_bot():
+            return chess.WHITE if self.white is not None else chess.BLACK
+        return self.turn()
+
+
+class TurnOutput:
+    __slots__ = ('lines', 'prompt', 'board')
+
+    def __init__(self, *lines):
+        """
+        Everything a game has to say about one turn: the move digests, check notice and prompt,
+        sent as a single message with the board attached.
+
+        :param lines: Lines to start with
+        """
+        self.lines = list(lines)
+        self.prompt = None
+        self.board = None
+
+    def add(self, line):
+        self.lines.append(line)
+
+    async def send(self, channel):
+        lines = self.lines + [self.prompt] if self.prompt else self.lines
+        if not lines and self.board is None:
+            return
+        file = File(io.BytesIO(self.board), filename='board.png') if self.board is not None else None
+        await channel.send('\n'.join(lines) or 'Board:', file=file)
+
+
+class ChessGameManager:
+    def __init__(self, router, game_factory, get_channel, on_finish, timeout=300, hot_games=64, store=None,
+                 restore_grace=60, spectators=None):
+        """
+        Games are advanced from router handlers and timed out by the router's timer wheel, so a game
+        waiting on a player has no task or future of its own, only its GameRecord. The ChessGame objects
+        of recently active games are kept in a small LRU and older ones are rebuilt from their moves.
+
+        :param router: router.MessageRouter delivering the players' messages
+        :param game_factory: Function building an empty chessgame.ChessGame for a GameRecord
+        :param get_channel: Function returning a channel from its ID
+        :param on_finish: Coroutine function called with (record, game, channel, ended_by, timed_out) once a
+            game is over, ended_by being the colour of the player who ended the game or let it time out
+        :param timeout: Seconds a player has to move
+        :param hot_games: Number of ChessGame objects to keep built
+        :param store: gamestore.GameStore to journal games to, so they survive a restart
+        :param restore_grace: Minimum seconds a player gets to move in a game restored after a restart
+        :param spectators: spectators.SpectatorHub to mirror every turn to
+        """
+        self.router = router
+        self.wheel = router.wheel
+        self.game_factory = game_factory
+        self.get_channel = get_channel
+        self.on_finish = on_finish
+        self.timeout = timeout
+        self.hot_games = hot_games
+        self.store = store
+        self.restore_grace = restore_grace
+        self.spectators = spectators
+        self.records = {}
+        self.seats = {}
+        self.hot = collections.OrderedDict()
+        self.ids = itertools.count(max(store.games, default=0) + 1 if store is not None else 1)
+
+    def playing(self, channel_id, user_id):
+        """
+        :return: True if the user is already playing a game in the channel
+        """
+        return (channel_id, user_id) in self.seats
+
+    def games_of(self, user_id):
+        """
+        :return: List of the GameRecords of the games a user is playing, most recent first
+        """
+        return sorted((record for record in self.records.values() if user_id in record.players()),
+                      key=lambda record: record.id, reverse=True)
+
+    def game(self, record):
+        """
+        :param record: GameRecord of the game
+        :return: The game's chessgame.ChessGame, rebuilt from its moves if it isn't kept
+        """
+        game = self.hot.get(record.id)
+        if game is not None:
+            self.hot.move_to_end(record.id)
+            return game
+
+        game = self.game_factory(record)
+        for value in record.moves:
+            game.board.push(decode_move(value))
+        self.hot[record.id] = game
+        if len(self.hot) > self.hot_games:
+            _, evicted = self.hot.popitem(last=False)
+            evicted.close()
+        return game
+
+    def add(self, record):
+        self.records[record.id] = record
+        for user_id in record.players():
+            self.seats[(record.channel_id, user_id)] = record.id
+            self.router.subscribe(record.channel_id, user_id, functools.partial(self.handle, record.id))
+
+    async def start(self, channel, white, black, easymode=False, intro=None):
+        """
+        Starts a game and plays the bot's first move if it has white.
+
+        :param channel: Channel to play in
+        :param white: Member playing white, None for the bot
+        :param black: Member playing black, None for the bot
+        :param easymode: Whether the bot plays the worst moves
+        :param intro: Line to open the game's first message with
+        :return: The game's GameRecord
+        """
+        record = GameRecord(next(self.ids), channel.id, white.id if white else None, black.id if black else None,
+                            white.display_name if white else BOT_NAME, black.display_name if black else BOT_NAME,
+                            easymode)
+        self.add(record)
+        if self.store is not None:
+            self.store.started(record)
+        game = self.game(record)
+        output = TurnOutput(intro) if intro else TurnOutput()
+        finished = failed = False
+        record.busy = True
+        try:
+            if record.player(chess.WHITE) is None:
+                try:
+                    await self.bot_move(record, game)
+                    finished = await self.advance(record, game, output)
+                except Exception:
+                    traceback.print_exc()
+                    failed = True
+            else:
+                self.prompt(record, game, output)
+            if not failed:
+                await self.publish(record, channel, output)
+        finally:
+            self.release(record)
+        if failed:
+            await self.abandon(record, channel, output)
+        elif finished:
+            await self.finish(record, channel)
+        return record
+
+    def restore(self):
+        """
+        Picks up the games the store reloaded. Only their records are rebuilt, a game's board is
+        built when its next move arrives. The player to move gets what was left of their time, but
+        at least restore_grace seconds, and games that were waiting on the bot are resumed. Games
+        the journal marks as ended by their last move, but that weren't finished before a restart,
+        are finished now.
+
+        :return:
+        """
+        if self.store is None:
+            return
+        games, self.store.games = self.store.games, {}
+        now = time.time()
+        for game_id, game in games.items():
+            record = GameRecord(game_id, game['channel'], game['white'], game['black'], game['white_name'],
+                                game['black_name'], game['easymode'],
+                                (encode_move(chess.Move.from_uci(move)) for move in game['moves']))
+            self.add(record)
+            if game.get('over'):
+                asyncio.ensure_future(self.finish(record, self.get_channel(record.channel_id)))
+            elif record.player(record.turn()) is None:
+                asyncio.ensure_future(self.resume(record))
+            else:
+                self.set_deadline(record, max(game['t'] + self.timeout - now, self.restore_grace))
+
+    async def resume(self, record):
+        channel = self.get_channel(record.channel_id)
+        if channel is None:
+            await self.finish(record, None)
+            return
+        output = TurnOutput()
+        finished = failed = False
+        record.busy = True
+        try:
+            game = self.game(record)
+            try:
+                await self.bot_move(record, game)
+                finished = await self.advance(record, game, output)
+            except Exception:
+                traceback.print_exc()
+                failed = True
+            else:
+                await self.publish(record, channel, output)
+        finally:
+            self.release(record)
+        if failed:
+            await self.abandon(record, channel, output)
+        elif finished:
+            await self.finish(record, channel)
+
+    async def handle(self, game_id, message):
+        """
+        Router handler for a player's message. Either player can end the game, otherwise only the
+        player to move is listened to. Messages that arrive while the game is busy with the previous
+        move are ignored.
+
+        :param game_id: ID of the game the message's channel and author belong to
+        :param message: The incoming message
+        :return:
+        """
+        record = self.records.get(game_id)
+        if record is None or record.busy or message.author.id not in record.players():
+            return
+
+        content = message.content.lower()
+        if content == 'end':
+            turn = record.turn()
+            ended_by = turn if message.author.id == record.player(turn) else not turn
+            await self.finish(record, message.channel, ended_by=ended_by)
+            return
+        if message.author.id != record.player(record.turn()) or UCI_REGEX.search(content) is None:
+            return
+
+        output = TurnOutput()
+        finished = failed = False
+        record.busy = True
+        try:
+            game = self.game(record)
+            try:
+                game.player_move(content)
+            except chessgame.InvalidMoveException as e:
+                await message.channel.send(str(e))
+                return
+            self.cancel_deadline(record)
+            self.played(record, game)
+            try:
+                finished = await self.advance(record, game, output)
+            except Exception:
+                traceback.print_exc()
+                failed = True
+            else:
+                await self.publish(record, message.channel, output)
+        finally:
+            self.release(record)
+        if failed:
+            await self.abandon(record, message.channel, output)
+        elif finished:
+            await self.finish(record, message.channel)
+
+    def release(self, record):
+        """
+        Marks a game as no longer busy and runs a timeout that came due while it was.
+
+        :return:
+        """
+        record.busy = False
+        if record.expired:
+            record.expired = False
+            self.expire(record.id)
+
+    async def abandon(self, record, channel, output):
+        """
+        Ends a game the bot couldn't move in, sending whatever the turn already had to say.
+
+        :param output: TurnOutput of the turn the bot failed in
+        :return:
+        """
+        output.prompt = None
+        output.add('Sorry, the chess engine failed, so this game has been abandoned.')
+        if channel is not None:
+            await self.publish(record, channel, output)
+        await self.finish(record, channel)
+
+    async def bot_move(self, record, game):
+        await game.ai_move()
+        game.start_pondering()
+        self.played(record, game)
+
+    def played(self, record, game):
+        """
+        Records the game's last move, journalling whether it ended the game so a restart can finish
+        it without rebuilding the board.
+
+        :return:
+        """
+        move = game.board.peek()
+        record.moves.append(encode_move(move))
+        if self.store is not None:
+            self.store.moved(record, move, over=game.is_finished())
+
+    async def advance(self, record, game, output):
+        """
+        Reports the last move, then plays the bot's reply until a player has to move or the game is over.
+
+        :param output: TurnOutput collecting the turn's message
+        :return: True if the game is over
+        """
+        while True:
+            output.add(game.generate_move_digest(record.name(not game.board.turn)))
+            if game.is_finished():
+                output.board = game.get_png(record.orientation())
+                return True
+            if game.check():
+                output.add('%s is in check!' % ('White' if game.board.turn else 'Black'))
+            if record.player(game.board.turn) is not None:
+                break
+            await self.bot_move(record, game)
+        self.prompt(record, game, output)
+        return False
+
+    def prompt(self, record, game, output):
+        if record.against_bot():
+            output.prompt = 'Please enter your move in UCI format (eg. e2e4)'
+        else:
+            output.prompt = '<@%s>, please enter your move in UCI format (eg. e2e4)' % record.player(record.turn())
+        output.board = game.get_png(record.orientation())
+        self.set_deadline(record, self.timeout)
+
+    async def publish(self, record, channel, output):
+        """
+        Sends a turn's message to the game's channel and mirrors it, without the prompt, to its spectators.
+        A failed send is only printed, so the caller still goes on to finish or abandon the game.
+
+        :return:
+        """
+        try:
+            await output.send(channel)
+        except Exception:
+            traceback.print_exc()
+        if self.spectators is not None and output.lines:
+            self.spectators.broadcast(record.id, '**%s vs %s**\n%s' % (record.white_name, record.black_name,
+                                                                      '\n'.join(output.lines)), output.board)
+
+    def set_deadline(self, record, delay):
+        self.cancel_deadline(record)
+        record.deadline = time.time() + delay
+        record.timer = self.wheel.schedule(delay, functools.partial(self.expire, record.id))
+
+    def cancel_deadline(self, record):
+        if record.timer is not None:
+            record.timer.cancel()
+        record.timer = None
+        record.deadline = None
+        record.expired = False
+
+    def expire(self, game_id):
+        record = self.records.get(game_id)
+        if record is None:
+            return
+        if record.busy:
+            # Runs once the game is released, unless the player's move cancels the deadline first
+            record.timer = None
+            record.expired = True
+            return
+        channel = self.get_channel(record.channel_id)
+        asyncio.ensure_future(self.finish(record, channel, ended_by=record.turn(), timed_out=True))
+
+    def remove(self, record):
+        self.records.pop(record.id, None)
+        self.cancel_deadline(record)
+        for user_id in record.players():
+            self.seats.pop((record.channel_id, user_id), None)
+            self.router.unsubscribe(record.channel_id, user_id)
+
+    async def finish(self, record, channel, ended_by=None, timed_out=False):
+        """
+        Removes a game and hands it to on_finish.
+
+        :param record: GameRecord of the game
+        :param channel: Channel the game was played in, None if it no longer exists
+        :param ended_by: Colour of the player who ended the game or let it time out, None if it was played out
+        :param timed_out: Whether the game ended because a player didn't move in time
+        :return:
+        """
+        if record.id not in self.records:
+            return
+        game = self.game(record)
+        del self.hot[record.id]
+        self.remove(record)
+        if self.store is not None:
+            self.store.ended(record)
+        game.close()
+        if self.spectators is not None:
+            if timed_out:
+                outcome = 'timed out'
+            elif ended_by is not None:
+                outcome = 'ended'
+            else:
+                outcome = game.result() if game.result() != '*' else 'abandoned'
+            self.spectators.broadcast(record.id, '**%s vs %s** is over: %s' % (record.white_name, record.black_name,
+                                                                             outcome))
+            self.spectators.drop(record.id)
+        await self.on_finish(record, game, channel, ended_by, timed_out)
+
+    def stats(self):
+        return {
+            'games': len(self.records),
+            'built': len(self.hot),
+            'waiting': sum(1 for record in self.records.values() if record.timer is not None),
+        }
+
+    def close(self):
+        for record in list(self.records.values()):
+            self.remove(record)
+        while self.hot:
+            _, game = self.hot.popitem()
+            game.close()
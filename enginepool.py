@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+EnginePool: Internal module for use in the FionaBot discord bot's chess functions.
+A pool of Stockfish processes shared by every game, driven through python-chess's asyncio API.
+"""
+import asyncio
+import collections
+import contextlib
+import os
+import chess.engine
+
+STOCKFISH_PATH = "stockfish_20011801_x64_modern.exe" if os.name == 'nt' else './stockfish_20011801_x64_modern'
+
+
+class EnginePool:
+    def __init__(self, path=STOCKFISH_PATH, size=2, spare=1, max_searches=None, options=None):
+        """
+        Engines are leased for a single search and handed back afterwards, so no game ever
+        holds a process while it waits on a player. A warm spare is kept started so a lease
+        rarely has to wait for a process to spawn, and dead engines are replaced.
+
+        :param path: Path of the UCI engine binary
+        :param size: Maximum number of engine processes
+        :param spare: Number of idle engines to keep started ahead of demand
+        :param max_searches: Maximum number of concurrent leases, at most size
+        :param options: Dict of UCI options to configure every engine with
+        """
+        self.path = path
+        self.size = size
+        self.spare = min(spare, size)
+        self.max_searches = min(max_searches or size, size)
+        self.options = options or {}
+
+        self.idle = collections.deque()
+        self.total = 0
+        self.spawning = 0
+        self.searches = None
+        self.changed = None
+
+        self.leases = 0
+        self.waits = 0
+        self.spawned = 0
+        self.crashes = 0
+
+    def setup(self):
+        # asyncio primitives are created on first use so they belong to the bot's event loop
+        if self.searches is None:
+            self.searches = asyncio.Semaphore(self.max_searches)
+            self.changed = asyncio.Condition()
+
+    @staticmethod
+    def alive(engine):
+        return not engine.returncode.done()
+
+    async def spawn(self):
+        """
+        Starts a new engine. The caller must already have counted it in self.total.
+
+        :return: The engine protocol
+        """
+        try:
+            _, engine = await chess.engine.popen_uci(self.path)
+            if self.options:
+                await engine.configure(self.options)
+        except BaseException:
+            self.total -= 1
+            raise
+        self.spawned += 1
+        return engine
+
+    async def spawn_spare(self):
+        try:
+            engine = await self.spawn()
+        except Exception:
+            return
+        finally:
+            self.spawning -= 1
+        self.idle.append(engine)
+        async with self.changed:
+            self.changed.notify()
+
+    def top_up(self):
+        """
+        Starts spawning engines until there are enough idle ones, within the size limit.
+
+        :return:
+        """
+        while len(self.idle) + self.spawning < self.spare and self.total < self.size:
+            self.total += 1
+            self.spawning += 1
+            asyncio.ensure_future(self.spawn_spare())
+
+    def start(self):
+        """
+        Warms up the spare engines.
+
+        :return:
+        """
+        self.setup()
+        self.top_up()
+
+    async def acquire(self):
+        while True:
+            while self.idle:
+                engine = self.idle.popleft()
+                if self.alive(engine):
+                    return engine
+                self.total -= 1
+                self.crashes += 1
+
+            if self.total < self.size:
+                self.total += 1
+                return await self.spawn()
+
+            # Every process is either leased to a search that is finishing or still spawning
+            self.waits += 1
+            async with self.changed:
+                await self.changed.wait()
+
+    async def release(self, engine, broken=False):
+        if broken or not self.alive(engine):
+            self.total -= 1
+            self.crashes += 1
+            with contextlib.suppress(Exception):
+                await asyncio.wait_for(engine.quit(), 5)
+        else:
+            self.idle.append(engine)
+        self.top_up()
+        async with self.changed:
+            self.changed.notify()
+
+    @contextlib.asynccontextmanager
+    async def lease(self):
+        """
+        Leases an engine for one search. At most max_searches leases run at once,
+        later ones wait their turn.
+
+        :return: Async context manager yielding a chess.engine.Protocol
+        """
+        self.setup()
+        async with self.searches:
+            engine = await self.acquire()
+            self.leases += 1
+            self.top_up()
+            broken = False
+            try:
+                yield engine
+            except (chess.engine.EngineError, chess.engine.EngineTerminatedError, asyncio.TimeoutError,
+                    asyncio.CancelledError):
+                # A cancelled search may have left the engine mid-command, so it is replaced
+                broken = True
+                raise
+            finally:
+                await self.release(engine, broken)
+
+    def available(self):
+        """
+        :return: True if a lease would start right away
+        """
+        return self.searches is None or not self.searches.locked()
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'processes': self.total,
+            'idle': len(self.idle),
+            'max_searches': self.max_searches,
+            'leases': self.leases,
+            'waits': self.waits,
+            'spawned': self.spawned,
+            'crashes': self.crashes,
+        }
+
+    async def close(self):
+        while self.idle:
+            engine = self.idle.popleft()
+            self.total -= 1
+            with contextlib.suppress(Exception):
+                await asyncio.wait_for(engine.quit(), 5)
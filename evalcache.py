@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+EvalCache: Internal module for use in the FionaBot discord bot's chess functions.
+Remembers engine evaluations by Zobrist hash so repeated positions skip the engine.
+"""
+import collections
+import sqlite3
+import chess
+import chess.engine
+import chess.polyglot
+
+Evaluation = collections.namedtuple('Evaluation', ['score', 'depth', 'move'])
+
+
+def to_signed(key):
+    # sqlite integers are signed 64 bit, Zobrist hashes are unsigned
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+class EvalCache:
+    def __init__(self, path='evals.sqlite3', size=100000, batch_size=256):
+        """
+        Evaluations are kept in an in-memory LRU in front of a sqlite table. New evaluations
+        are written to disk in batches, and a deeper evaluation always replaces a shallower one.
+
+        :param path: Path of the sqlite database, or None to keep everything in memory
+        :param size: Maximum number of evaluations in the in-memory LRU
+        :param batch_size: Number of new evaluations to collect before writing them to disk
+        """
+        self.size = size
+        self.batch_size = batch_size
+        self.entries = collections.OrderedDict()
+        self.pending = {}
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.shallow = 0
+        self.misses = 0
+
+        self.db = sqlite3.connect(path) if path is not None else None
+        if self.db is not None:
+            self.db.execute('CREATE TABLE IF NOT EXISTS evals (hash INTEGER PRIMARY KEY, cp INTEGER, mate INTEGER, '
+                            'depth INTEGER NOT NULL, move TEXT)')
+            self.db.commit()
+
+    @staticmethod
+    def key(board):
+        return chess.polyglot.zobrist_hash(board)
+
+    def remember(self, key, evaluation):
+        self.entries[key] = evaluation
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def load(self, key):
+        if self.db is None:
+            return None
+        row = self.db.execute('SELECT cp, mate, depth, move FROM evals WHERE hash = ?', (to_signed(key),)).fetchone()
+        if row is None:
+            return None
+        cp, mate, depth, move = row
+        score = chess.engine.Mate(mate) if mate is not None else chess.engine.Cp(cp)
+        return Evaluation(chess.engine.PovScore(score, chess.WHITE), depth,
+                          chess.Move.from_uci(move) if move else None)
+
+    def get(self, board, min_depth=0):
+        """
+        Looks up an evaluation of a position.
+
+        :param board: Position to look up
+        :param min_depth: Minimum search depth the evaluation must come from
+        :return: Evaluation(score, depth, move) or None if there is no deep enough evaluation
+        """
+        key = self.key(board)
+        evaluation = self.entries.get(key)
+        if evaluation is not None:
+            source = 'memory'
+            self.entries.move_to_end(key)
+        else:
+            source = 'disk'
+            evaluation = self.load(key)
+            if evaluation is not None:
+                self.remember(key, evaluation)
+
+        if evaluation is None:
+            self.misses += 1
+            return None
+        if evaluation.depth < min_depth:
+            self.shallow += 1
+            return None
+        if source == 'memory':
+            self.memory_hits += 1
+        else:
+            self.disk_hits += 1
+        return evaluation
+
+    def put(self, board, score, depth, move=None):
+        """
+        Stores an evaluation unless a deeper one is already known.
+
+        :param board: Position that was evaluated
+        :param score: chess.engine.PovScore of the position
+        :param depth: Depth of the search the score came from
+        :param move: Best move found, if any
+        :return:
+        """
+        key = self.key(board)
+        known = self.entries.get(key)
+        if known is not None and known.depth > depth:
+            return
+        evaluation = Evaluation(chess.engine.PovScore(score.white(), chess.WHITE), depth, move)
+        self.remember(key, evaluation)
+        if self.db is not None:
+            self.pending[key] = evaluation
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        if self.db is None or not self.pending:
+            return
+        rows = [(to_signed(key), evaluation.score.white().score(), evaluation.score.white().mate(), evaluation.depth,
+                 evaluation.move.uci() if evaluation.move else None)
+                for key, evaluation in self.pending.items()]
+        self.pending.clear()
+        self.db.executemany('INSERT INTO evals VALUES (?, ?, ?, ?, ?) ON CONFLICT(hash) DO UPDATE SET '
+                            'cp = excluded.cp, mate = excluded.mate, depth = excluded.depth, move = excluded.move '
+                            'WHERE excluded.depth >= evals.depth', rows)
+        self.db.commit()
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.shallow + self.misses
+        return {
+            'entries': len(self.entries),
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'too_shallow': self.shallow,
+            'misses': self.misses,
+            'hit_rate': '%0.1f%%' % (100 * hits / lookups if lookups else 0),
+        }
+
+    def close(self):
+        self.flush()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,150 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+GameAnalyser: Internal module for use in the FionaBot discord bot's chess functions.
+Analyses uploaded PGN games position by position over the shared engine pool.
+"""
+import asyncio
+import collections
+import io
+import math
+import chess
+import chess.engine
+import chess.pgn
+
+GameReport = collections.namedtuple('GameReport', ['white', 'black', 'result', 'plies', 'accuracy', 'blunders',
+                                                   'mistakes', 'inaccuracies'])
+
+# Drops in winning chances, on lichess' -1 to 1 scale, that make a move an inaccuracy, mistake or blunder
+INACCURACY = 0.1
+MISTAKE = 0.2
+BLUNDER = 0.3
+
+
+def win_percent(score):
+    """
+    Lichess' conversion of an evaluation to a chance of winning.
+
+    :param score: chess.engine.Score from the point of view of the player
+    :return: Winning chance from 0 to 100
+    """
+    centipawns = max(-1000, min(1000, score.score(mate_score=100000)))
+    return 50 + 50 * (2 / (1 + math.exp(-0.00368208 * centipawns)) - 1)
+
+
+def move_accuracy(win_before, win_after):
+    """
+    Lichess' accuracy of a single move from the mover's winning chances before and after it.
+
+    :return: Accuracy from 0 to 100
+    """
+    if win_after >= win_before:
+        return 100.0
+    return max(0.0, min(100.0, 103.1668 * math.exp(-0.04354 * (win_before - win_after)) - 3.1669))
+
+
+class GameAnalyser:
+    def __init__(self, engines, nodes=200000, concurrency=None, cache=None, cache_depth=12):
+        """
+        Every position of a game is searched with a fixed node budget, several at once, through
+        the engine pool. Each upload gets its own cap on concurrent searches, kept below the
+        pool's own limit whenever it allows more than one, so one large file leaves an engine free
+        for games and other uploads.
+
+        :param engines: enginepool.EnginePool to lease engines from
+        :param nodes: Node budget per position
+        :param concurrency: Maximum number of searches one upload runs at once, defaults to all but one
+            of the pool's concurrent searches
+        :param cache: evalcache.EvalCache to reuse and store evaluations in
+        :param cache_depth: Minimum depth of a cached evaluation to use instead of searching
+        """
+        self.engines = engines
+        self.limit = chess.engine.Limit(nodes=nodes)
+        bound = max(1, engines.max_searches - 1)
+        self.concurrency = min(concurrency, bound) if concurrency else bound
+        self.cache = cache
+        self.cache_depth = cache_depth
+
+    async def evaluate(self, board, slots):
+        """
+        :param board: Position to evaluate
+        :param slots: asyncio.Semaphore capping the upload's concurrent searches
+        :return: chess.engine.PovScore of the position
+        """
+        if board.is_game_over():
+            outcome = board.outcome()
+            if outcome.winner is None:
+                return chess.engine.PovScore(chess.engine.Cp(0), chess.WHITE)
+            return chess.engine.PovScore(chess.engine.Mate(0), not outcome.winner)
+
+        if self.cache is not None:
+            cached = self.cache.get(board, self.cache_depth)
+            if cached is not None:
+                return cached.score
+
+        async with slots:
+            async with self.engines.lease() as engine:
+                info = await engine.analyse(board, self.limit, info=chess.engine.INFO_SCORE)
+        if self.cache is not None and 'depth' in info:
+            self.cache.put(board, info['score'], info['depth'])
+        return info['score']
+
+    async def analyse(self, game, slots):
+        """
+        :param game: chess.pgn.Game to analyse
+        :param slots: asyncio.Semaphore capping the upload's concurrent searches
+        :return: GameReport
+        """
+        board = game.board()
+        boards = [board.copy(stack=False)]
+        moves = []
+        for move in game.mainline_moves():
+            moves.append((board.fullmove_number, board.turn, board.san(move)))
+            board.push(move)
+            boards.append(board.copy(stack=False))
+
+        scores = await asyncio.gather(*(self.evaluate(position, slots) for position in boards))
+
+        accuracy = {chess.WHITE: [], chess.BLACK: []}
+        blunders = []
+        mistakes = {chess.WHITE: 0, chess.BLACK: 0}
+        inaccuracies = {chess.WHITE: 0, chess.BLACK: 0}
+        for (number, color, san), before, after in zip(moves, scores, scores[1:]):
+            win_before = win_percent(before.pov(color))
+            win_after = win_percent(after.pov(color))
+            accuracy[color].append(move_accuracy(win_before, win_after))
+
+            drop = (win_before - win_after) / 50
+            if drop >= BLUNDER:
+                blunders.append('%s%s %s' % (number, '.' if color == chess.WHITE else '...', san))
+            elif drop >= MISTAKE:
+                mistakes[color] += 1
+            elif drop >= INACCURACY:
+                inaccuracies[color] += 1
+
+        return GameReport(game.headers.get('White', '?'), game.headers.get('Black', '?'),
+                          game.headers.get('Result', '*'), len(moves),
+                          {color: sum(values) / len(values) if values else None for color, values in accuracy.items()},
+                          blunders, mistakes, inaccuracies)
+
+    async def analyse_pgn(self, text, max_games=10):
+        """
+        Reads games out of a PGN one at a time and analyses each as it is read.
+
+        :param text: PGN text with one or more games
+        :param max_games: Maximum number of games to analyse
+        :return: Async generator of (game number, GameReport), or (game number, None) for a game that
+            couldn't be analysed or has no moves
+        """
+        slots = asyncio.Semaphore(self.concurrency)
+        pgn = io.StringIO(text)
+        for number in range(1, max_games + 1):
+            game = chess.pgn.read_game(pgn)
+            if game is None:
+                return
+            if (game.errors or game.headers.get('Variant', 'Standard') != 'Standard'
+                    or game.next() is None):
+                yield number, None
+                continue
+            yield number, await self.analyse(game, slots)
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+GameStore: Internal module for use in the FionaBot discord bot's chess functions.
+Journals every chess game's moves so games in progress survive a restart.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+import traceback
+
+
+class GameStore:
+    def __init__(self, path='chess_games.journal', flush_interval=2):
+        """
+        Append-only journal with one JSON line per operation: a game starting, a move and a game
+        ending. Lines are written as they happen and fsynced in batches every flush_interval seconds.
+        Loading replays the journal and rewrites it with only the games still in progress, which
+        are left in self.games for the game manager to pick up.
+
+        :param path: Path of the journal
+        :param flush_interval: Seconds between background fsyncs
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_task = None
+        self.file = None
+        self.dirty = False
+
+        self.games = self.load()
+
+    def load(self):
+        """
+        Replays the journal and compacts it to the games still in progress.
+
+        :return: Dict of game ID to a dict of the game's start operation, with 'moves' as a list of
+            UCI moves, 't' as the time of its last operation and 'over' set if its last move ended it
+        """
+        games = {}
+        try:
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        # A line torn by a crash mid-write, nothing after it was written
+                        break
+                    self.apply(games, op)
+        except FileNotFoundError:
+            pass
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix='.chess-', suffix='.journal', dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            for game in games.values():
+                f.write(json.dumps(game, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+        self.file = open(self.path, 'a')
+        return games
+
+    @staticmethod
+    def apply(games, op):
+        kind = op['op']
+        if kind == 'start':
+            games[op['id']] = dict(op, moves=list(op.get('moves', ())))
+        elif kind == 'move':
+            game = games.get(op['id'])
+            if game is not None:
+                game['moves'].append(op['move'])
+                game['t'] = op['t']
+                if op.get('over'):
+                    game['over'] = True
+        elif kind == 'end':
+            games.pop(op['id'], None)
+
+    def write(self, op):
+        op['t'] = time.time()
+        self.file.write(json.dumps(op, separators=(',', ':')) + '\n')
+        self.dirty = True
+
+    def started(self, record):
+        self.write({'op': 'start', 'id': record.id, 'channel': record.channel_id, 'white': record.white,
+                    'black': record.black, 'white_name': record.white_name, 'black_name': record.black_name,
+                    'easymode': record.easymode, 'moves': []})
+
+    def moved(self, record, move, over=False):
+        op = {'op': 'move', 'id': record.id, 'move': move.uci()}
+        if over:
+            op['over'] = True
+        self.write(op)
+
+    def ended(self, record):
+        self.write({'op': 'end', 'id': record.id})
+
+    def flush(self):
+        if self.dirty:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.dirty = False
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # A failed fsync leaves the journal dirty, so the next one retries it
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self, loop):
+        if self.flush_task is None:
+            self.flush_task = loop.create_task(self.flush_periodically())
+
+    def stop(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        self.flush()
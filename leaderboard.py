@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+Leaderboard: Internal module for use in the FionaBot discord bot's leveling system.
+Keeps every guild's members ranked by XP so the top lists don't need to sort the member list.
+"""
+import bisect
+
+
+class Ranking:
+    def __init__(self):
+        """
+        Members ranked by XP, kept as a sorted list of (-xp, user_id) keys.
+        """
+        self.keys = []
+        self.scores = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, user_id):
+        return user_id in self.scores
+
+    def set(self, user_id, score):
+        """
+        Inserts a member or moves them to their new position.
+
+        :param user_id: ID of the member
+        :param score: The member's new XP
+        :return:
+        """
+        old_score = self.scores.get(user_id)
+        if old_score == score:
+            return
+        if old_score is not None:
+            del self.keys[bisect.bisect_left(self.keys, (-old_score, user_id))]
+        self.scores[user_id] = score
+        bisect.insort(self.keys, (-score, user_id))
+
+    def add(self, user_id, amount):
+        self.set(user_id, self.scores.get(user_id, 0) + amount)
+
+    def remove(self, user_id):
+        score = self.scores.pop(user_id, None)
+        if score is not None:
+            del self.keys[bisect.bisect_left(self.keys, (-score, user_id))]
+
+    def score(self, user_id):
+        return self.scores.get(user_id, 0)
+
+    def rank(self, user_id):
+        """
+        :param user_id: ID of the member
+        :return: 1-based rank of the member, or None if they aren't ranked
+        """
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return bisect.bisect_left(self.keys, (-score, user_id)) + 1
+
+    def page(self, start, count):
+        """
+        :param start: 0-based rank to start at
+        :param count: Maximum number of entries to return
+        :return: List of (rank, user_id, score) tuples
+        """
+        return [(start + i + 1, user_id, -score) for i, (score, user_id) in
+                enumerate(self.keys[start:start + count])]
+
+
+class Leaderboard:
+    def __init__(self, users):
+        """
+        Per-guild XP rankings. Guilds are indexed the first time they are asked about,
+        and kept up to date by add_xp afterwards.
+
+        :param users: UserStore the XP totals come from
+        """
+        self.users = users
+        self.guilds = {}
+        self.memberships = {}
+
+    def experience(self, user_id):
+        record = self.users.get(user_id)
+        return record['experience'] if record is not None else 0
+
+    def guild(self, guild):
+        """
+        Gets the ranking for a guild, building it from the member list if needed.
+
+        :param guild: discord.Guild to get the ranking for
+        :return: Ranking of the guild's members
+        """
+        ranking = self.guilds.get(guild.id)
+        if ranking is None:
+            ranking = Ranking()
+            for member in guild.members:
+                if not member.bot:
+                    ranking.set(str(member.id), self.experience(str(member.id)))
+                    self.memberships.setdefault(str(member.id), set()).add(guild.id)
+            self.guilds[guild.id] = ranking
+        return ranking
+
+    def add_member(self, member):
+        ranking = self.guilds.get(member.guild.id)
+        if ranking is not None and not member.bot:
+            ranking.set(str(member.id), self.experience(str(member.id)))
+            self.memberships.setdefault(str(member.id), set()).add(member.guild.id)
+
+    def remove_member(self, member):
+        ranking = self.guilds.get(member.guild.id)
+        if ranking is not None:
+            ranking.remove(str(member.id))
+            self.memberships.get(str(member.id), set()).discard(member.guild.id)
+
+    def update(self, user_id):
+        """
+        Moves a user to their current XP in every indexed guild they belong to.
+
+        :param user_id: ID of the user whose XP changed
+        :return:
+        """
+        score = self.experience(user_id)
+        for guild_id in self.memberships.get(user_id, ()):
+            self.guilds[guild_id].set(user_id, score)
@@ -7,14 +7,33 @@ A discord bot for general gaming purposes. Currently contains dice rolling and c
 
 import random
 import asyncio
-import aiohttp
 import datetime
 import json
 import io
 import regex
 import inspect
 import chessgame
+import enginepool
+import evalcache
+import rendercache
+import openingbook
+import tablebase
+import chessmanager
+import gamestore
+import pgnarchive
+import gameanalysis
+import replaygif
+import spectators
 import initiative
+import userstore
+import leaderboard
+import xpjournal
+import router
+import triggers
+import assets
+import waifupack
+import webclient
+import tio
 import rolldice
 import trueskill
 import sys
@@ -22,11 +41,9 @@ import markovify
 import bs4
 import hashlib
 import randomart
-import copy
 import astar
 import zlib
 import itertools
-from fuzzywuzzy import fuzz
 from discord import *
 from discord.ext.commands import *
 from discord import utils
@@ -38,42 +55,6 @@ clever_api_user = 'CLEVERBOT USER HERE'
 clever_api_key = 'CLEVERBOT KEY HERE'
 '''
 
-UCI_REGEX = '([a-h][1-8]){2}(qrknb)?'
-
-
-class TIOSerializer:
-    def __init__(self):
-        self.bytes = b''
-
-    def add_variable(self, name, contents: list):
-        self.bytes += b'V' + name.encode('utf-8') + b'\0' + str(len(contents)).encode('utf-8') + b'\0'
-
-        for var in contents:
-            self.bytes += var.encode('utf-8') + b'\0'
-
-    def add_file(self, name, contents: str):
-        self.bytes += b'F' + name.encode('utf-8') + b'\0' + str(len(contents.encode('utf-8'))).encode('utf-8') \
-                      + b'\0' + contents.encode('utf-8')
-
-    def add_run(self):
-        self.bytes += b'R'
-
-    def add_lang(self, language):
-        self.add_variable('lang', [language])
-
-    def add_code(self, code):
-        self.add_file('.code.tio', code)
-
-    def add_input(self, contents):
-        self.add_file('.input.tio', contents)
-
-    def add_args(self, args):
-        self.add_variable('args', args)
-
-    def dump(self):
-        return self.bytes
-
-
 try:
     import config
 except ImportError:
@@ -251,8 +232,68 @@ class ReplacementHelpCommand(HelpCommand):
         await self.send_pages()
 
 
-client = Bot(command_prefix=config.prefix,
-             description='''A bot written by fiona#1729 for use in various discord servers.
+class FionaBot(Bot):
+    async def close(self):
+        """
+        Writes out any pending leveling data before logging out
+
+        :return:
+        """
+        user_store.stop()
+        xp_journal.stop()
+        chess_games.close()
+        spectator_hub.close()
+        chess_store.stop()
+        game_archive.close()
+        await http_client.close()
+        await engine_pool.close()
+        eval_cache.close()
+        for book in opening_books.values():
+            book.close()
+        if endgame_tables is not None:
+            endgame_tables.close()
+        await super().close()
+
+
+user_store = userstore.UserStore('users.json')
+http_client = webclient.HttpClient(limit_per_host=getattr(config, 'http_limit_per_host', 10),
+                                   timeout=getattr(config, 'http_timeout', 30))
+tio_languages = tio.LanguageCatalogue(http_client, 'tio_languages.json')
+engine_pool = enginepool.EnginePool(size=getattr(config, 'engine_pool_size', 2),
+                                    spare=getattr(config, 'engine_spare', 1),
+                                    max_searches=getattr(config, 'engine_max_searches', None))
+eval_cache = evalcache.EvalCache('evals.sqlite3', size=getattr(config, 'eval_cache_size', 100000))
+board_images = rendercache.RenderCache(chessgame.default_renderer, size=getattr(config, 'render_cache_size', 512),
+                                       directory=getattr(config, 'render_cache_dir', None))
+opening_books = openingbook.load(getattr(config, 'opening_books', {}),
+                                 max_depth=getattr(config, 'opening_book_depth', 12))
+try:
+    endgame_tables = tablebase.Tablebase(config.syzygy_path) if getattr(config, 'syzygy_path', None) else None
+except FileNotFoundError:
+    endgame_tables = None
+replay_encoder = replaygif.ReplayEncoder(chessgame.default_renderer)
+game_analyser = gameanalysis.GameAnalyser(engine_pool, nodes=getattr(config, 'analysis_nodes', 200000),
+                                          concurrency=getattr(config, 'analysis_concurrency', None), cache=eval_cache)
+worstfish_options = {'limit': chessgame.chess.engine.Limit(time=getattr(config, 'worstfish_time', 1.0)),
+                     'rank': getattr(config, 'worstfish_rank', 1),
+                     'multipv': getattr(config, 'worstfish_multipv', True)}
+chess_timeout = getattr(config, 'chess_timeout', 300)
+# How long a player has to move, as put in messages, eg. '5 minutes'
+chess_time_limit = ('%d minute%s' % (chess_timeout // 60, '' if chess_timeout == 60 else 's')
+                    if chess_timeout % 60 == 0 else '%d seconds' % chess_timeout)
+xp_leaderboard = leaderboard.Leaderboard(user_store)
+xp_journal = xpjournal.XPJournal('xp.journal', 'xp.snapshot.json')
+message_router = router.MessageRouter()
+message_triggers = triggers.TriggerEngine(getattr(config, 'triggers', None), getattr(config, 'guild_triggers', None))
+reaction_assets = assets.AssetRegistry(message_triggers.files())
+
+try:
+    waifu_pack = waifupack.WaifuPack('waifus.pack')
+except FileNotFoundError:
+    waifu_pack = None
+
+client = FionaBot(command_prefix=config.prefix,
+                  description='''A bot written by fiona#1729 for use in various discord servers.
               Can play chess, roll dice, and track initiative, among other things.''')
 
 client.help_command = ReplacementHelpCommand()
@@ -283,36 +324,38 @@ async def update_data(users, user):
     """
     Used in the leveling system. If a user is not already included in the users file, add them.
 
-    :param users: JSON object containing users data
+    :param users: UserStore containing users data
     :param user: discord.User to add
     :return:
     """
     users_rating = trueskill.Rating()
     if str(user.id) not in users and not user.bot:
-        users[str(user.id)] = {}
-        users[str(user.id)]['experience'] = 0
-        users[str(user.id)]['level'] = 1
-        users[str(user.id)]['trueskill'] = {'mu': users_rating.mu, 'sigma': users_rating.sigma}
+        users[str(user.id)] = {'experience': 0, 'level': 1,
+                               'trueskill': {'mu': users_rating.mu, 'sigma': users_rating.sigma}}
 
 
 async def add_xp(users, user, amount):
     """
     Adds experience to a user in the leveling system
 
-    :param users: JSON object containing users data
+    :param users: UserStore containing users data
     :param user: discord.User to add experience to
     :param amount: Amount of experience to add
     :return:
     """
     if not user.bot:
         users[str(user.id)]['experience'] += amount
+        users.mark_dirty(str(user.id))
+        xp_leaderboard.update(str(user.id))
+        guild = getattr(user, 'guild', None)
+        xp_journal.record(guild.id if guild is not None else 0, user.id, amount)
 
 
 async def level_up(users, user, channel):
     """
     Handles user leveling up. Checks if users level has increased and if so displays a message.
 
-    :param users: JSON object containing users data
+    :param users: UserStore containing users data
     :param user: User to check if leveled up
     :param channel: Channel to send message in
     :return:
@@ -326,9 +369,11 @@ async def level_up(users, user, channel):
             await channel.send('%s leveled up to level %s and gained a skill rank! They now have %s skill ranks!' %
                                (user.mention, lvl_end, lvl_end // 5))
             users[str(user.id)]['level'] = lvl_end
+            users.mark_dirty(str(user.id))
         elif lvl_end > lvl_start:
             await channel.send('%s leveled up to level %s!' % (user.display_name, lvl_end))
             users[str(user.id)]['level'] = lvl_end
+            users.mark_dirty(str(user.id))
 
 
 @client.event
@@ -338,12 +383,15 @@ async def on_ready():
 
     :return:
     """
-    async with aiohttp.ClientSession() as session:
-        raw_response = await session.post('https://cleverbot.io/1.0/create',
-                                          json={'user': config.clever_api_user, 'key': config.clever_api_key,
-                                                'nick': 'Fiona'})
+    user_store.start(client.loop)
+    xp_journal.start(client.loop)
+    engine_pool.start()
+    chess_store.start(client.loop)
+    chess_games.restore()
+    async with http_client.post('https://cleverbot.io/1.0/create',
+                                json={'user': config.clever_api_user, 'key': config.clever_api_key,
+                                      'nick': 'Fiona'}) as raw_response:
         await raw_response.text()
-        await session.close()
     link = utils.oauth_url('464543446187769867', permissions=Permissions.all())
     await client.change_presence(activity=Game(name='f?help for help'))
     sys.stdout.write('Logged in as ' + client.user.display_name + '\n')
@@ -358,13 +406,19 @@ async def on_member_join(member):
     :param member: Member that joined.
     :return:
     """
-    with open('users.json', 'r') as f:
-        users = json.load(f)
+    await update_data(user_store, member)
+    xp_leaderboard.add_member(member)
+
 
-    await update_data(users, member)
+@client.event
+async def on_member_remove(member):
+    """
+    Removes users from the server leaderboard
 
-    with open('users.json', 'w') as f:
-        json.dump(users, f)
+    :param member: Member that left.
+    :return:
+    """
+    xp_leaderboard.remove_member(member)
 
 
 @client.event
@@ -379,33 +433,20 @@ async def on_message(message):
     if message.author.bot:
         return
 
-    if 'seduce' in message.content.lower():
-        await message.channel.send('Seduce me!', file=File('seduce.png'))
-
-    if message.content.lower() == 'mirage':
-        await message.channel.send(
-            'now dont get me started on the mirage 2000 hahah its so bad like wtf french the best plane they ever made was a flag blown away by the wind it works great actualy but the mirage is so ugly i dont enven now how it can even fly i know a friend is part of the raf he flew three (yes, 3) mirage and the worst was the deux mille i mean its a flying pankace and really how can a french plane work anyway they dont even now how cars work look at renault its so bad right so yes the mirage is pretty shitty right yeah')
-
-    if message.content.lower() == 'thatsthejoke.jpg':
-        await message.channel.send('THATS THE JOKE', file=File('thatsthejoke.gif'))
-	
-    if message.content.lower() in ['it\'s fine', 'its fine', 'i\'m fine', 'im fine', 'i am fine']:
-        await message.channel.send('Everything is Fine!', file=File('Z.png'))
-
-    if message.content.lower() == '@someone':
-        server = message.guild
-        member = random.choice(server.members)
-        await message.channel.send(member.mention)
+    message_router.dispatch(message)
 
-    with open('users.json', 'r') as f:
-        users = json.load(f)
-
-    await update_data(users, message.author)
-    await add_xp(users, message.author, 7)
-    await level_up(users, message.author, message.channel)
+    for trigger in message_triggers.match(message.guild.id if message.guild else None, message.content):
+        if trigger.get('action') == 'mention_random':
+            if message.guild is not None:
+                await message.channel.send(random.choice(message.guild.members).mention)
+        elif trigger.get('file'):
+            await reaction_assets.send(message.channel, trigger['response'], trigger['file'])
+        else:
+            await message.channel.send(trigger['response'])
 
-    with open('users.json', 'w') as f:
-        json.dump(users, f)
+    await update_data(user_store, message.author)
+    await add_xp(user_store, message.author, 7)
+    await level_up(user_store, message.author, message.channel)
 
     # Do this so we can still use commands
     await client.process_commands(message)
@@ -423,10 +464,9 @@ async def invitelink(context):
 async def clever(context, *message):
     message = ' '.join(message)
 
-    async with aiohttp.ClientSession() as session:  # Async HTTP request
-        raw_response = await session.post('https://cleverbot.io/1.0/ask',
-                                          json={'user': config.clever_api_user, 'key': config.clever_api_key,
-                                                'nick': 'Fiona', 'text': message})
+    async with http_client.post('https://cleverbot.io/1.0/ask',
+                                json={'user': config.clever_api_user, 'key': config.clever_api_key,
+                                      'nick': 'Fiona', 'text': message}) as raw_response:  # Async HTTP request
         response = await raw_response.text()  # Take only the data
         response = json.loads(response)  # Parse the JSON into a format we can use
         # This is the JSON path for the price data in USD
@@ -449,10 +489,9 @@ async def level(context, mention: Member):
     :param mention: User mentioned in command
     :return:
     """
-    with open('users.json', 'r') as f:
-        users = json.load(f)
+    await update_data(user_store, mention)
 
-    await context.send('%s is level %s!' % (mention.display_name, users[str(mention.id)]['level']))
+    await context.send('%s is level %s!' % (mention.display_name, user_store[str(mention.id)]['level']))
 
 
 @client.command(description='Check a user\'s XP. This command takes one mention. ',
@@ -468,42 +507,64 @@ async def xp(context, mention: Member):
     :param mention: User mentioned in command
     :return:
     """
-    with open('users.json', 'r') as f:
-        users = json.load(f)
+    await update_data(user_store, mention)
 
-    await context.send('%s has %s experience!' % (mention.display_name, users[str(mention.id)]['experience']))
+    await context.send('%s has %s experience!' % (mention.display_name, user_store[str(mention.id)]['experience']))
 
 
-@client.command(description='List the top 5 users in the server by XP.',
+@client.command(description='List the top users in the server by XP, 10 per page. '
+                            'Optionally takes \'week\' or \'month\' to rank by XP earned recently, '
+                            'and a page number. Also shows your own rank.',
                 brief='List top users by XP')
-async def top(context):
-    with open('users.json', 'r') as f:
-        users = json.load(f)
+async def top(context, *args):
+    """
+    Command to list the server leaderboard
 
-    def get_xp(user):
-        try:
-            return users[str(user.id)]['experience']
-        except:
-            return 0
+    :param context: Command context
+    :param args: Optional window ('week' or 'month') and page number, starting at 1
+    :return:
+    """
+    window = None
+    page = 1
+    for arg in args:
+        if arg.isdigit():
+            page = max(int(arg), 1)
+        elif arg.lower() in xp_journal.windows:
+            window = arg.lower()
+        elif arg.lower() != 'all':
+            await context.send('Unknown leaderboard %s! Try %s.' % (arg, ', '.join(['all'] + list(xp_journal.windows))))
+            return
 
-    def get_level(user):
-        try:
-            return users[str(user.id)]['level']
-        except:
-            return 0
-
-    if len(context.guild.members) >= 1:
-        userList = copy.copy(context.guild.members)
-        userList.sort(key=get_xp, reverse=True)
-        ranking = ''
-        for i in range(10):
-            if len(userList[i].display_name) > 20:
-                ranking += '%s. %s...: %s levels, %s xp\n' % (
-                    i + 1, userList[i].display_name[:17], get_level(userList[i]), get_xp(userList[i]))
-            else:
-                ranking += '%s. %s: %s levels, %s xp\n' % (
-                    i + 1, userList[i].display_name, get_level(userList[i]), get_xp(userList[i]))
-        await context.send('Rankings for this server:\n```%s```' % ranking)
+    if window is None:
+        ranking = xp_leaderboard.guild(context.guild)
+        title = 'Rankings for this server'
+    else:
+        ranking = xp_journal.ranking(context.guild.id, window)
+        title = 'Rankings for this server this %s' % window
+
+    def get_level(user_id):
+        record = user_store.get(user_id)
+        return record['level'] if record is not None else 0
+
+    def get_name(user_id):
+        member = context.guild.get_member(int(user_id))
+        name = member.display_name if member is not None else 'Unknown'
+        return name[:17] + '...' if len(name) > 20 else name
+
+    entries = ranking.page((page - 1) * 10, 10)
+    if not entries:
+        await context.send('There are only %s ranked users in this server!' % len(ranking))
+        return
+
+    lines = ''
+    for rank, user_id, experience in entries:
+        lines += '%s. %s: %s levels, %s xp\n' % (rank, get_name(user_id), get_level(user_id), experience)
+
+    own_rank = ranking.rank(str(context.author.id))
+    if own_rank is not None:
+        lines += '\nYou are #%s of %s with %s xp\n' % (own_rank, len(ranking), ranking.score(str(context.author.id)))
+
+    await context.send('%s:\n```%s```' % (title, lines))
 
 
 @client.command(name='8ball',
@@ -580,7 +641,7 @@ async def dicemode(context):
     await context.send('Beginning dice rolling mode...')
     while True:
         try:
-            msg = await client.wait_for('message', check=lambda m: m.author == context.author, timeout=6000)
+            msg = await message_router.wait_for(None, context.author, timeout=6000)
         except asyncio.TimeoutError:
             break
         else:
@@ -598,335 +659,352 @@ async def dicemode(context):
                     await context.send('Result: %s.\n```%s```' % (result, explanation))
 
 
-@client.group()
-async def chess(context):
+def new_chess_game(record):
     """
-    Chess command group
+    Builds an empty ChessGame for a game in chess_games
 
-    :param context: Command context
-    :return:
+    :param record: chessmanager.GameRecord of the game
+    :return: chessgame.ChessGame
     """
-    if context.invoked_subcommand is None:
-        await context.send('Invalid chess command.')
+    if not record.against_bot():
+        return chessgame.ChessGame(renderer=board_images)
+    return chessgame.ChessGame(difficulty=not record.easymode, engines=engine_pool,
+                               worstfish_options=worstfish_options, eval_cache=eval_cache,
+                               cache_depth=getattr(config, 'eval_cache_depth', 20), renderer=board_images,
+                               book=opening_books.get('easy' if record.easymode else 'hard'),
+                               tablebase=endgame_tables, ponder=getattr(config, 'chess_ponder', True))
 
 
-@chess.group(description='Starts a game of chess with the bot. To end a game of chess, type \'end\' instead of '
-                         'entering your move. You must enter your move within 5 minutes or the game will time out. ',
-             brief='Start a game of chess.')
-async def new(context):
+async def chess_game_over(record, chess_game, channel, ended_by, timed_out):
     """
-    New game command group
-
-    :param context: Command context
-    :return:
-    """
-    if context.invoked_subcommand is None:
-        await context.send('Invalid new game. Please use the subcommand white or black.')
-
-
-@cooldown(2, 60, BucketType.user)
-@new.command(description='Starts a game of chess with the bot. To end a game of chess, type \'end\' instead of '
-                         'entering your move. You must enter your move within 5 minutes or the game will time out. ',
-             brief='Start a game of chess as white. ')
-async def white(context, easymode: bool = False):
-    """
-    Command to start a new game of chess vs AI as white
-
-    todo:: Allow for selecting different difficulty levels
+    Rates a finished challenge and posts the results of a game
 
-    :param context: Command context
+    :param record: chessmanager.GameRecord of the game
+    :param chess_game: chessgame.ChessGame of the game
+    :param channel: Channel the game was played in
+    :param ended_by: Colour of the player who ended the game or timed out, None if it was played out
+    :param timed_out: Whether a player didn't move in time
     :return:
     """
-    timed_out = False
-
-    user = context.message.author
-
-    chess_game = chessgame.ChessGame(difficulty=not easymode)
+    result = chess_game.result()
 
-    await context.send('Starting new game as white.')
+    archived_result = result
+    if result == '*' and ended_by is not None:
+        archived_result = '0-1' if ended_by == chessgame.chess.WHITE else '1-0'
+    game_id = game_archive.add(chess_game.board, record.white, record.black, record.white_name, record.black_name,
+                               archived_result)
 
-    file = chess_game.get_png(chessgame.chess.WHITE)
-    file = io.BytesIO(file)
-    file = File(file, filename='board.png')
-    await context.send('Board:', file=file)
-    while True:
-        end = False
-        if chess_game.check():
-            await context.send('White is in check!')
-        while True:
-            await context.send('Please enter your move in UCI format (eg. e2e4)')
-            try:
-                movestr = await client.wait_for('message', check=lambda m: (
-                    m.author == context.author and m.channel == context.channel), timeout=300)
-            except asyncio.TimeoutError:
-                end = True
-                timed_out = True
-                break
+    if not record.against_bot():
+        white_rating = trueskill.Rating(**user_store[str(record.white)]['trueskill'])
+        black_rating = trueskill.Rating(**user_store[str(record.black)]['trueskill'])
 
-            match = regex.search(UCI_REGEX, movestr.content.lower())
+        if result == '1-0' or ended_by == chessgame.chess.BLACK:
+            white_rating, black_rating = trueskill.rate_1vs1(white_rating, black_rating)
+        elif result == '0-1' or ended_by == chessgame.chess.WHITE:
+            black_rating, white_rating = trueskill.rate_1vs1(black_rating, white_rating)
 
-            if movestr.content.lower() == 'end':
-                end = True
-                break
+        user_store[str(record.white)]['trueskill'] = {'mu': white_rating.mu, 'sigma': white_rating.sigma}
+        user_store.mark_dirty(str(record.white))
+        user_store[str(record.black)]['trueskill'] = {'mu': black_rating.mu, 'sigma': black_rating.sigma}
+        user_store.mark_dirty(str(record.black))
 
-            elif match != None:
-                try:
-                    chess_game.player_move(movestr.content.lower())
-                    break
-
-                except chessgame.InvalidMoveException as e:
-                    await context.send(str(e))
-
-        if end:
-            break
-        await context.send(chess_game.generate_move_digest(user.display_name))
-        file = chess_game.get_png(chessgame.chess.WHITE)
-        file = io.BytesIO(file)
-        file = File(file, filename='board.png')
-        await context.send('Board:', file=file)
-        if chess_game.is_finished():
-            break
-        if chess_game.check():
-            await context.send('Black is in check!')
-        chess_game.ai_move()
-        await context.send(chess_game.generate_move_digest('FionaBot'))
-        file = chess_game.get_png(chessgame.chess.WHITE)
-        file = io.BytesIO(file)
-        file = File(file, filename='board.png')
-        await context.send('Board:', file=file)
-        if chess_game.is_finished():
-            break
+    if channel is None:
+        return
 
     if timed_out:
-        await context.send('Game timed out. Next time please make a move within 5 minutes.')
+        await channel.send('Game timed out. Next time please make a move within %s.' % chess_time_limit)
 
     date_string = f"{datetime.date.today():%Y.%m.%d}"
-    pgn = chess_game.get_pgn('Chess Game', 'Discord', date_string, user.display_name, "FionaBot")
+    pgn = chess_game.get_pgn('Chess Game', 'Discord', date_string, record.white_name, record.black_name)
 
     embed = Embed(title="Chess Game Results", colour=Colour(0xff00), description="```%s```" % pgn)
 
     embed.set_author(name="FionaBot", icon_url="https://tinyurl.com/y8p7a8px")
+    embed.set_footer(text='Game #%s' % game_id)
 
-    embed.add_field(name="Human Player: White", value=context.author.display_name)
-    embed.add_field(name="Bot Player: Black", value="FionaBot")
-    embed.add_field(name="Final Score", value=chess_game.result())
+    if record.against_bot():
+        human = chessgame.chess.WHITE if record.white is not None else chessgame.chess.BLACK
+        embed.add_field(name="Human Player: %s" % ('White' if human else 'Black'), value=record.name(human))
+        embed.add_field(name="Bot Player: %s" % ('Black' if human else 'White'), value="FionaBot")
+    else:
+        embed.add_field(name="White", value='%s\nRating: %0.3f' % (record.white_name, white_rating.mu))
+        embed.add_field(name="Black", value='%s\nRating: %0.3f' % (record.black_name, black_rating.mu))
+    embed.add_field(name="Final Score", value=result)
+
+    if getattr(config, 'chess_replay_gif', False) and chess_game.board.move_stack:
+        replay = replay_encoder.encode(chess_game.board.move_stack, record.orientation() if record.against_bot()
+                                       else chessgame.chess.WHITE)
+        embed.set_image(url='attachment://replay.gif')
+        await channel.send(embed=embed, file=File(io.BytesIO(replay), filename='replay.gif'))
+    else:
+        await channel.send(embed=embed)
 
-    await context.send(embed=embed)
 
-    chess_game.engine.close()
+chess_store = gamestore.GameStore('chess_games.journal')
+game_archive = pgnarchive.PGNArchive('games.pgn', 'games.sqlite3')
+spectator_hub = spectators.SpectatorHub(client.get_channel, interval=getattr(config, 'spectator_interval', 1.0))
+chess_games = chessmanager.ChessGameManager(message_router, new_chess_game, client.get_channel, chess_game_over,
+                                            timeout=chess_timeout, store=chess_store,
+                                            spectators=spectator_hub)
 
 
-@cooldown(2, 60, BucketType.user)
-@new.command(description='Starts a game of chess with the bot. To end a game of chess, type \'end\' instead of '
-                         'entering your move. You must enter your move within 5 minutes or the game will time out. ',
-             brief='Start a game of chess as white.')
-async def black(context, easymode: bool = False):
+@client.group()
+async def chess(context):
     """
-    Command to start a new game of chess vs AI as black
+    Chess command group
 
     :param context: Command context
     :return:
     """
-    timed_out = False
-
-    user = context.message.author
-
-    chess_game = chessgame.ChessGame(difficulty=not easymode)
+    if context.invoked_subcommand is None:
+        await context.send('Invalid chess command.')
 
-    await context.send('Starting new game as black.')
 
-    file = chess_game.get_png(chessgame.chess.BLACK)
-    file = io.BytesIO(file)
-    file = File(file, filename='board.png')
-    await context.send('Board:', file=file)
-    while True:
-        end = False
-        if chess_game.check():
-            await context.send('White is in check!')
-        chess_game.ai_move()
-        await context.send(chess_game.generate_move_digest('FionaBot'))
-        file = chess_game.get_png(chessgame.chess.BLACK)
-        file = io.BytesIO(file)
-        file = File(file, filename='board.png')
-        await context.send('Board:', file=file)
-        if chess_game.is_finished():
-            break
-        if chess_game.check():
-            await context.send('Black is in check!')
-        while True:
-            await context.send('Please enter your move in UCI format (eg. e2e4)')
-            try:
-                movestr = await client.wait_for('message', check=lambda m: (
-                    m.author == context.author and m.channel == context.channel), timeout=300)
-            except asyncio.TimeoutError:
-                end = True
-                timed_out = True
-                break
+@chess.command(description='Show how busy the shared chess engines are and how often '
+                           'cached evaluations and board images saved work. ',
+               brief='Show chess engine statistics.')
+async def enginestats(context):
+    """
+    Command to show engine pool and evaluation cache statistics
 
-            match = regex.search(UCI_REGEX, movestr.content.lower())
+    :param context: Command context
+    :return:
+    """
+    pool = '\n'.join('%s: %s' % item for item in engine_pool.stats().items())
+    cache = '\n'.join('%s: %s' % item for item in eval_cache.stats().items())
+    images = '\n'.join('%s: %s' % item for item in board_images.stats().items())
+    books = '\n'.join('%s: %s' % (difficulty, book.stats()) for difficulty, book in opening_books.items())
+    tables = '\n'.join('%s: %s' % item for item in endgame_tables.stats().items()) if endgame_tables else 'none'
+    games = '\n'.join('%s: %s' % item for item in list(chess_games.stats().items()) +
+                      [('spectator_' + key, value) for key, value in spectator_hub.stats().items()])
+    await context.send('Engine pool:\n```%s```Evaluation cache:\n```%s```Board image cache:\n```%s```'
+                       'Opening books:\n```%s```Endgame tablebase:\n```%s```Games:\n```%s```' %
+                       (pool, cache, images, books or 'none', tables, games))
+
+
+@chess.command(description='List the games a user has finished, 10 per page, most recent first. '
+                           'Takes an optional mention and page number. ',
+               brief='List finished chess games.')
+async def history(context, member: Member = None, page: int = 1):
+    """
+    Command to list a user's archived games
 
-            if movestr.content.lower() == 'end':
-                end = True
-                break
+    :param context: Command context
+    :param member: User to list the games of, defaults to the author
+    :param page: Page number, starting at 1
+    :return:
+    """
+    member = member or context.author
+    page = max(page, 1)
+    games = game_archive.history(member.id, (page - 1) * 10, 10)
+    if not games:
+        await context.send('%s has no finished games on page %s!' % (member.display_name, page))
+        return
 
-            elif match != None:
-                try:
-                    chess_game.player_move(movestr.content.lower())
-                    break
+    lines = ''
+    for game_id, date, white_name, black_name, result, eco in games:
+        lines += '#%s %s: %s vs %s, %s%s\n' % (game_id, date, white_name, black_name, result,
+                                               ' (%s)' % eco if eco else '')
+    await context.send('Games played by %s:\n```%s```Use `chess game <number>` to see one.' %
+                       (member.display_name, lines))
 
-                except chessgame.InvalidMoveException as e:
-                    await context.send(str(e))
-        if end:
-            break
-        await context.send(chess_game.generate_move_digest(user.display_name))
-        file = chess_game.get_png(chessgame.chess.BLACK)
-        file = io.BytesIO(file)
-        file = File(file, filename='board.png')
-        await context.send('Board:', file=file)
-        if chess_game.is_finished():
-            break
 
-    if timed_out:
-        await context.send('Game timed out. Next time please make a move within 5 minutes.')
+@chess.command(description='Show how a user has done in their finished games and which openings they play most. ',
+               brief='Show chess statistics for a user.')
+async def stats(context, member: Member = None):
+    """
+    Command to show a user's record from the game archive
 
-    date_string = f"{datetime.date.today():%Y.%m.%d}"
-    pgn = chess_game.get_pgn('Chess Game', 'Discord', date_string, user.display_name, "FionaBot")
+    :param context: Command context
+    :param member: User to show, defaults to the author
+    :return:
+    """
+    member = member or context.author
+    record = game_archive.stats(member.id)
+    if not record['games']:
+        await context.send('%s has no finished games!' % member.display_name)
+        return
 
-    embed = Embed(title="Chess Game Results", colour=Colour(0xff00), description="```%s```" % pgn)
+    lines = 'Games: %s\nWins: %s\nDraws: %s\nLosses: %s\n' % (record['games'], record['wins'], record['draws'],
+                                                              record['losses'])
+    if record['openings']:
+        lines += 'Openings: %s\n' % ', '.join('%s (%s)' % opening for opening in record['openings'])
+    await context.send('Chess record for %s:\n```%s```' % (member.display_name, lines))
 
-    embed.set_author(name="FionaBot", icon_url="https://tinyurl.com/y8p7a8px")
 
-    embed.add_field(name="Human Player: Black", value=context.author.display_name)
-    embed.add_field(name="Bot Player: White", value="FionaBot")
-    embed.add_field(name="Final Score", value=chess_game.result())
+@chess.command(name='game', description='Show the PGN of a finished game by its number. ',
+               brief='Show a finished chess game.')
+async def archived_game(context, game_id: int):
+    """
+    Command to fetch a game from the archive
 
-    await context.send(embed=embed)
+    :param context: Command context
+    :param game_id: Number of the game
+    :return:
+    """
+    pgn = game_archive.pgn(game_id)
+    if pgn is None:
+        await context.send('There is no game #%s!' % game_id)
+    elif len(pgn) > 1900:
+        await context.send('Game #%s:' % game_id, file=File(io.BytesIO(pgn.encode('utf-8')),
+                                                             filename='game%s.pgn' % game_id))
+    else:
+        await context.send('Game #%s:\n```%s```' % (game_id, pgn))
 
-    chess_game.engine.close()
 
+@cooldown(1, 60, BucketType.user)
+@chess.command(name='analyse', aliases=['analyze'],
+               description='Analyse the games in an attached PGN file. Each game\'s accuracy, blunders, mistakes '
+                           'and inaccuracies are posted as soon as it has been analysed. At most 10 games per file. ',
+               brief='Analyse games from a PGN file.')
+async def analyse_games(context):
+    """
+    Command to analyse an uploaded PGN with the engine pool
 
-@cooldown(2, 60, BucketType.user)
-@new.command(description='Challenge the mentioned user to a game of chess. To end the game, type \'end\'. ',
-             brief='Challenge a person to a game of chess')
-async def challenge(context, white: Member):
-    timed_out = False
+    :param context: Command context
+    :return:
+    """
+    if not context.message.attachments:
+        await context.send('Please attach a PGN file to analyse.')
+        return
+    attachment = context.message.attachments[0]
+    if attachment.size > 1024 * 1024:
+        await context.send('That file is too big! Please keep PGN files under 1 MB.')
+        return
 
-    black = context.author
+    text = (await attachment.read()).decode('utf-8', errors='replace')
+    await context.send('Analysing %s...' % attachment.filename)
+
+    analysed = 0
+    async for number, report in game_analyser.analyse_pgn(text, getattr(config, 'analysis_max_games', 10)):
+        analysed += 1
+        if report is None:
+            await context.send('Game %s could not be read, skipping it.' % number)
+            continue
+
+        lines = ''
+        for color, name in ((chessgame.chess.WHITE, report.white), (chessgame.chess.BLACK, report.black)):
+            accuracy = report.accuracy[color]
+            lines += '%s: %s accuracy, %s mistakes, %s inaccuracies\n' % (
+                name, '%0.1f%%' % accuracy if accuracy is not None else 'no moves', report.mistakes[color],
+                report.inaccuracies[color])
+        lines += 'Blunders: %s\n' % (', '.join(report.blunders) or 'none')
+        await context.send('Game %s, %s vs %s (%s), %s plies:\n```%s```' % (
+            number, report.white, report.black, report.result, report.plies, lines))
+
+    if not analysed:
+        await context.send('There were no games in that file!')
+
+
+@chess.command(description='Mirror the game a mentioned user is playing to this channel. '
+                           'Use \'stop\' instead of a mention to stop spectating every game in this channel. ',
+               brief='Spectate a chess game in this channel.')
+async def spectate(context, *args):
+    """
+    Command to mirror a running game to the current channel
 
-    await context.send('%s, %s has challenged you to a chess game!' % (white.mention, black.mention))
+    :param context: Command context
+    :param args: A mention of a player, or 'stop'
+    :return:
+    """
+    if args and args[0].lower() == 'stop':
+        stopped = spectator_hub.unwatch(context.channel.id)
+        await context.send('Stopped spectating %s game%s.' % (stopped, '' if stopped == 1 else 's'))
+        return
 
-    with open('users.json') as f:
-        users = json.load(f)
+    if not context.message.mentions:
+        await context.send('Please mention a player whose game you want to spectate.')
+        return
+    if context.guild is None:
+        await context.send('Games can only be spectated in a server channel!')
+        return
+    player = context.message.mentions[0]
+    # Only games in this server are mirrored, so games from other servers or DMs never leak here
+    games = [record for record in chess_games.games_of(player.id)
+             if getattr(client.get_channel(record.channel_id), 'guild', None) == context.guild]
+    if not games:
+        await context.send('%s isn\'t playing a game of chess in this server right now!' % player.display_name)
+        return
 
-    if str(white.id) not in users:
-        await update_data(users, white)
-    elif str(black.id) not in users:
-        await update_data(users, black)
+    record = games[0]
+    if record.channel_id == context.channel.id:
+        await context.send('That game is already being played in this channel!')
+        return
+    spectator_hub.watch(record.id, context.channel.id)
+    await context.send('Spectating %s vs %s. Their moves will be posted here.' % (record.white_name,
+                                                                               record.black_name))
 
-    white_rating = trueskill.Rating(**users[str(white.id)]['trueskill'])
 
-    black_rating = trueskill.Rating(**users[str(black.id)]['trueskill'])
+@chess.group(description='Starts a game of chess with the bot. To end a game of chess, type \'end\' instead of '
+                         'entering your move. You must enter your move within %s or the game will time out. '
+                         % chess_time_limit,
+             brief='Start a game of chess.')
+async def new(context):
+    """
+    New game command group
 
-    chess_game = chessgame.ChessGame()
+    :param context: Command context
+    :return:
+    """
+    if context.invoked_subcommand is None:
+        await context.send('Invalid new game. Please use the subcommand white or black.')
 
-    file = chess_game.get_png(chessgame.chess.WHITE)
-    file = io.BytesIO(file)
-    file = File(file, filename='board.png')
-    await context.send('Board:', file=file)
 
-    while True:
-        end = False
+@cooldown(2, 60, BucketType.user)
+@new.command(description='Starts a game of chess with the bot. To end a game of chess, type \'end\' instead of '
+                         'entering your move. You must enter your move within %s or the game will time out. '
+                         % chess_time_limit,
+             brief='Start a game of chess as white. ')
+async def white(context, easymode: bool = False):
+    """
+    Command to start a new game of chess vs AI as white
 
-        # White's move
-        while True:
-            await context.send('%s, please enter your move in UCI format (eg. e2e4)' % white.mention)
-            try:
-                move_str = await client.wait_for('message',
-                                                 check=lambda m: (m.author == white and m.channel == context.channel),
-                                                 timeout=300)
-            except asyncio.TimeoutError:
-                end = True
-                timed_out = True
-                break
-            if move_str.content.lower() == 'end':
-                end = True
-                break
-            try:
-                chess_game.player_move(move_str.content.lower())
-                break
-            except chessgame.InvalidMoveException as e:
-                await context.send(str(e))
-        if end:
-            white_ended = True
-            break
-        await context.send(chess_game.generate_move_digest(white.display_name))
-        if chess_game.is_finished():
-            break
+    todo:: Allow for selecting different difficulty levels
 
-        # Black's move
-        file = chess_game.get_png(chessgame.chess.BLACK)
-        file = io.BytesIO(file)
-        file = File(file, filename='board.png')
-        await context.send('Board:', file=file)
-        if chess_game.check():
-            await context.send('Black is in check!')
-        while True:
-            await context.send('%s, please enter your move in UCI format (eg. e2e4)' % black.mention)
-            try:
-                move_str = await client.wait_for('message',
-                                                 check=lambda m: (m.author == black and m.channel == context.channel),
-                                                 timeout=300)
-            except asyncio.TimeoutError:
-                end = True
-                timed_out = True
-                break
-            if move_str.content.lower() == 'end':
-                end = True
-                break
-            try:
-                chess_game.player_move(move_str.content.lower())
-                break
-            except chessgame.InvalidMoveException as e:
-                await context.send(str(e))
-        if end:
-            black_ended = True
-            break
-        await context.send(chess_game.generate_move_digest(black.display_name))
-        if chess_game.is_finished():
-            break
+    :param context: Command context
+    :return:
+    """
+    if chess_games.playing(context.channel.id, context.author.id):
+        await context.send('You already have a game of chess going in this channel.')
+        return
 
-        file = chess_game.get_png(chessgame.chess.WHITE)
-        file = io.BytesIO(file)
-        file = File(file, filename='board.png')
-        await context.send('Board:', file=file)
+    await chess_games.start(context.channel, context.author, None, easymode, intro='Starting new game as white.')
 
-    if chess_game.result() == '1-0' or black_ended:
-        white_rating, black_rating = trueskill.rate_1vs1(white_rating, black_rating)
-    elif chess_game.result() == '0-1' or white_ended:
-        black_rating, white_rating = trueskill.rate_1vs1(black_rating, white_rating)
 
-    with open('users.json') as f:
-        users = json.load(f)
-        users[str(white.id)]['trueskill'] = {'mu': white_rating.mu, 'sigma': white_rating.sigma}
-        users[str(black.id)]['trueskill'] = {'mu': black_rating.mu, 'sigma': black_rating.sigma}
+@cooldown(2, 60, BucketType.user)
+@new.command(description='Starts a game of chess with the bot. To end a game of chess, type \'end\' instead of '
+                         'entering your move. You must enter your move within %s or the game will time out. '
+                         % chess_time_limit,
+             brief='Start a game of chess as white.')
+async def black(context, easymode: bool = False):
+    """
+    Command to start a new game of chess vs AI as black
 
-    if timed_out:
-        await context.send('Game timed out. Next time please make a move within 5 minutes.')
+    :param context: Command context
+    :return:
+    """
+    if chess_games.playing(context.channel.id, context.author.id):
+        await context.send('You already have a game of chess going in this channel.')
+        return
 
-    date_string = f"{datetime.date.today():%Y.%m.%d}"
-    pgn = chess_game.get_pgn('Chess Game', 'Discord', date_string, white.display_name, black.display_name)
+    await chess_games.start(context.channel, None, context.author, easymode, intro='Starting new game as black.')
 
-    embed = Embed(title="Chess Game Results", colour=Colour(0xff00), description="```%s```" % pgn)
 
-    embed.set_author(name="FionaBot", icon_url="https://tinyurl.com/y8p7a8px")
+@cooldown(2, 60, BucketType.user)
+@new.command(description='Challenge the mentioned user to a game of chess. To end the game, type \'end\'. ',
+             brief='Challenge a person to a game of chess')
+async def challenge(context, white: Member):
+    black = context.author
 
-    embed.add_field(name="White", value='%s\nRating: %0.3f' % (white.display_name, white_rating.mu))
-    embed.add_field(name="Black", value='%s\nRating: %0.3f' % (black.display_name, black_rating.mu))
-    embed.add_field(name="Final Score", value=chess_game.result())
+    if chess_games.playing(context.channel.id, white.id) or chess_games.playing(context.channel.id, black.id):
+        await context.send('One of you already has a game of chess going in this channel.')
+        return
 
-    await context.send(embed=embed)
+    await update_data(user_store, white)
+    await update_data(user_store, black)
 
-    chess_game.engine.close()
+    await chess_games.start(context.channel, white, black,
+                            intro='%s, %s has challenged you to a chess game!' % (white.mention, black.mention))
 
 
 @client.command(
@@ -958,7 +1036,7 @@ async def initiative_command(context, *args):
         await context.send('```%s```' % init.get_players())
         while should_continue:
             try:
-                command = await client.wait_for('message', check=lambda m: m.author == context.author, timeout=6000)
+                command = await message_router.wait_for(None, context.author, timeout=6000)
             except asyncio.TimeoutError:
                 should_continue = False
                 timed_out = True
@@ -1024,9 +1102,8 @@ async def markov(context, num_sentences: int = 8):
 @client.command(description="Fetch a random joke. ",
                 brief="Fetch a random joke. ")
 async def jokes(context):
-    async with aiohttp.ClientSession() as session:  # Async HTTP request
-        raw_response = await session.post(
-            'http://api.icndb.com/jokes/random?firstName=Fiona&lastName=Bot&escape=javascript')
+    async with http_client.post(
+            'http://api.icndb.com/jokes/random?firstName=Fiona&lastName=Bot&escape=javascript') as raw_response:
         response = await raw_response.text()  # Take only the data
         response = json.loads(response)  # Parse the JSON into a format we can use
     joke = response['value']['joke']
@@ -1038,14 +1115,24 @@ async def jokes(context):
 @client.command(description="Send a random pickup line. ",
                 brief="Send a random pickup line. ")
 async def pickmeup(context):
-    async with aiohttp.ClientSession() as session:  # Async HTTP request
-        raw_response = await session.get('http://pebble-pickup.herokuapp.com/tweets/random')
+    async with http_client.get('http://pebble-pickup.herokuapp.com/tweets/random') as raw_response:
         response = await raw_response.text()  # Take only the data
         response = json.loads(response)  # Parse the JSON into a format we can use
     joke = response['tweet']
     await context.send(joke)
 
 
+@client.command(description="Show the shared HTTP client's request counters and connection pool usage. ",
+                brief="Show HTTP pool statistics. ")
+@is_owner()
+async def httpstats(context):
+    stats = http_client.stats()
+    hosts = '\n'.join('  %s: %s' % (host, count) for host, count in
+                      sorted(stats.pop('hosts').items(), key=lambda item: item[1], reverse=True))
+    lines = '\n'.join('%s: %s' % (name, value) for name, value in stats.items())
+    await context.send('```%s\nhosts:\n%s```' % (lines, hosts))
+
+
 @client.command(description="Prune last N messages from a channel ",
                 brief="Prune messages. ")
 @has_permissions(manage_messages=True)
@@ -1066,8 +1153,7 @@ async def source(context, *command):
     source = str(inspect.getsource(client.get_command(' '.join(command)).callback))
     source_formatted = '```py\n' + source.replace('`', '\u200b`') + '\n```'
     if len(source_formatted) > 2000:
-        async with aiohttp.ClientSession() as session:
-            raw_response = await session.post("https://hastebin.com/documents", data=source)
+        async with http_client.post("https://hastebin.com/documents", data=source) as raw_response:
             response = await raw_response.text()
             response = json.loads(response)
         uid = response['key']
@@ -1097,8 +1183,7 @@ async def sauce(context, link=None, similarity: int = 80):
             similarity = link
         else:
             url = link
-        async with aiohttp.ClientSession() as session:
-            response = await session.get('http://saucenao.com/search.php?url={}'.format(url))
+        async with http_client.get('http://saucenao.com/search.php?url={}'.format(url)) as response:
             source = None
             if response.status == 200:
                 soup = bs4.BeautifulSoup(await response.text(), 'html.parser')
@@ -1125,11 +1210,17 @@ async def animegrill(context, id: int = None):
         await context.send('Invalid Waifu ID!')
         return
 
-    with open('waifugen/results-fionabot/finbot-waifu-%s.jpg' % id, 'rb') as f:
-        waifu = f.read()
-        waifu = io.BytesIO(waifu)
-        file = File(waifu, filename='finbot-waifu-%s.jpg' % id)
-        await context.send('FionaBot Waifu #%s' % id, file=file)
+    try:
+        if waifu_pack is not None:
+            waifu = waifu_pack.open(id)
+        else:
+            waifu = open('waifugen/results-fionabot/finbot-waifu-%s.jpg' % id, 'rb')
+    except (KeyError, FileNotFoundError):
+        await context.send('Waifu #%s doesn\'t exist!' % id)
+        return
+
+    file = File(waifu, filename='finbot-waifu-%s.jpg' % id)
+    await context.send('FionaBot Waifu #%s' % id, file=file)
 
 
 @client.command(description="Creates an ascii art 'randomart' out of a given string. "
@@ -1142,7 +1233,7 @@ async def animegrill(context, id: int = None):
 async def art(context):
     await context.send('Waiting for text input.')
 
-    text = await client.wait_for('message', check=lambda m: m.author == context.author, timeout=6000)
+    text = await message_router.wait_for(None, context.author, timeout=6000)
 
     text = text.content.strip('` ').upper()
     text = regex.sub(r'[^\w ]', ' ', text)
@@ -1171,7 +1262,7 @@ async def art(context):
 async def pathfind(context):
     await context.send('Please send your board:')
 
-    board = await client.wait_for('message', check=lambda m: m.author == context.author, timeout=6000)
+    board = await message_router.wait_for(None, context.author, timeout=6000)
     board = board.content.strip('`"\' \t\n')
     try:
         gif = astar.draw_path(board)
@@ -1203,15 +1294,8 @@ async def search(context, *langname):
         return
 
     results = {}
-    async with aiohttp.ClientSession() as session:
-        response = await session.get('https://tio.run/languages.json')
-
-        if response.status == 200:
-            body = json.loads(await response.text())
-
-            for lang in body.keys():
-                if fuzz.partial_ratio(body[lang]['name'], ' '.join(langname)) > 75:
-                    results[lang] = body[lang]['name']
+    if await tio_languages.get() is not None:
+        results = tio_languages.search(' '.join(langname))
     if results:
         await context.send('Languages results: ```%s```' % '\n'.join([
             '%s: %s' % (id, name) for id, name in results.items()
@@ -1227,24 +1311,19 @@ async def search(context, *langname):
                           "language's interpreter",
               brief="Run code in a language.")
 async def run(context, language, ask_input: bool = False, *args):
-    async with aiohttp.ClientSession() as session:
-        response = await session.get('https://tio.run/languages.json')
-
-        if response.status == 200:
-            body = json.loads(await response.text())
-
-            if language not in body:
-                await context.send('Unknown language!')
-                return
+    languages = await tio_languages.get()
+    if languages is not None and language not in languages:
+        await context.send('Unknown language!')
+        return
 
     await context.send('Please send your code wrapped in triple backticks!')
 
-    message = await client.wait_for('message', check=lambda m: m.author == context.author, timeout=6000)
+    message = await message_router.wait_for(None, context.author, timeout=6000)
 
     if ask_input:
         await context.send('Please send your code\'s input')
 
-        input_message = await client.wait_for('message', check=lambda m: m.author == context.author, timeout=6000)
+        input_message = await message_router.wait_for(None, context.author, timeout=6000)
 
         input_message = input_message.content
     else:
@@ -1259,32 +1338,25 @@ async def run(context, language, ask_input: bool = False, *args):
     try:
         code = message[1]
 
-        tio = TIOSerializer()
-
-        tio.add_lang(language)
-
-        tio.add_code(code)
-
-        tio.add_input(input_message)
+        serializer = tio.TIOSerializer()
 
-        tio.add_args(args if args else [])
+        serializer.add_lang(language)
 
-        tio.add_run()
+        serializer.add_code(code)
 
-        byte_data = tio.dump()
+        serializer.add_input(input_message)
 
-        async with aiohttp.ClientSession() as session:
-            response = await session.post('https://tio.run/cgi-bin/static/fb67788fd3d1ebf92e66b295525335af-run',
-                                          data=zlib.compress(byte_data, 9)[2:-4])
+        serializer.add_args(args if args else [])
 
-            response_data = zlib.decompress((await response.read())[10:], wbits=-15)
+        serializer.add_run()
 
-        split = response_data[:16]
+        pieces = await tio.run(http_client, serializer)
 
-        split_data = regex.split(regex.escape(split), response_data)
+        output = '\n'.join(['```%s```' % piece for piece in pieces if piece])
+        if len(output) > 2000:
+            output = output[:1994] + '...```'
 
-        await context.send('\n'.join(['```%s```' % piece.decode('utf-8', errors='replace') for piece in split_data if
-                                      piece.decode('utf-8', errors='replace')]))
+        await context.send(output)
 
     except:
         await context.send('Error running program!')
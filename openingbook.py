@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+OpeningBook: Internal module for use in the FionaBot discord bot's chess functions.
+Plays the bot's first moves from polyglot opening books instead of searching them.
+"""
+import random
+import chess.polyglot
+
+
+class OpeningBook:
+    def __init__(self, path, max_depth=12, minimum_weight=1):
+        """
+        A polyglot .bin book. Moves are picked at random weighted by their book weight,
+        so games starting from the same position don't all go the same way.
+
+        :param path: Path of the polyglot book
+        :param max_depth: Number of plies from the start of the game to play book moves for
+        :param minimum_weight: Book entries with a lower weight are never played
+        """
+        self.path = path
+        self.max_depth = max_depth
+        self.minimum_weight = minimum_weight
+        self.reader = chess.polyglot.open_reader(path)
+        self.random = random.Random()
+
+        self.hits = 0
+        self.misses = 0
+
+    def choose(self, board):
+        """
+        :param board: Position to find a book move for
+        :return: A chess.Move, or None if the book is exhausted or the game is past max_depth
+        """
+        if board.ply() >= self.max_depth:
+            return None
+        entries = list(self.reader.find_all(board, minimum_weight=self.minimum_weight))
+        if not entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.random.choices([entry.move for entry in entries],
+                                   weights=[entry.weight for entry in entries])[0]
+
+    def stats(self):
+        return {
+            'path': self.path,
+            'max_depth': self.max_depth,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+    def close(self):
+        self.reader.close()
+
+
+def load(paths, max_depth=12):
+    """
+    Opens a book per difficulty, skipping any that aren't there.
+
+    :param paths: Dict of difficulty name ('hard' or 'easy') to book path
+    :param max_depth: Number of plies to play book moves for
+    :return: Dict of difficulty name to OpeningBook
+    """
+    books = {}
+    for difficulty, path in paths.items():
+        try:
+            books[difficulty] = OpeningBook(path, max_depth)
+        except FileNotFoundError:
+            pass
+    return books
@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+PGNArchive: Internal module for use in the FionaBot discord bot's chess functions.
+Keeps every finished game in one PGN file, with a sqlite index of who played what and where it is.
+"""
+import datetime
+import os
+import sqlite3
+import chess
+import chess.pgn
+
+# Opening move sequences in UCI to (ECO code, name). Games are classified by their longest matching prefix.
+ECO_TABLE = {
+    'e2e4': ('B00', "King's Pawn Opening"),
+    'e2e4 e7e5': ('C20', "King's Pawn Game"),
+    'e2e4 e7e5 d1h5': ('C20', "King's Pawn Game: Wayward Queen Attack"),
+    'e2e4 e7e5 f1c4': ('C23', "Bishop's Opening"),
+    'e2e4 e7e5 b1c3': ('C25', 'Vienna Game'),
+    'e2e4 e7e5 f2f4': ('C30', "King's Gambit"),
+    'e2e4 e7e5 g1f3': ('C40', "King's Knight Opening"),
+    'e2e4 e7e5 g1f3 d7d6': ('C41', 'Philidor Defence'),
+    'e2e4 e7e5 g1f3 g8f6': ('C42', 'Petrov Defence'),
+    'e2e4 e7e5 g1f3 b8c6': ('C44', "King's Knight Opening: Normal Variation"),
+    'e2e4 e7e5 g1f3 b8c6 d2d4': ('C45', 'Scotch Game'),
+    'e2e4 e7e5 g1f3 b8c6 f1c4': ('C50', 'Italian Game'),
+    'e2e4 e7e5 g1f3 b8c6 f1b5': ('C60', 'Ruy Lopez'),
+    'e2e4 c7c5': ('B20', 'Sicilian Defence'),
+    'e2e4 c7c5 c2c3': ('B22', 'Sicilian Defence: Alapin Variation'),
+    'e2e4 c7c5 b1c3': ('B23', 'Sicilian Defence: Closed'),
+    'e2e4 c7c5 g1f3 d7d6 d2d4 c5d4 f3d4 g8f6 b1c3 a7a6': ('B90', 'Sicilian Defence: Najdorf Variation'),
+    'e2e4 e7e6': ('C00', 'French Defence'),
+    'e2e4 c7c6': ('B10', 'Caro-Kann Defence'),
+    'e2e4 d7d5': ('B01', 'Scandinavian Defence'),
+    'e2e4 g8f6': ('B02', "Alekhine's Defence"),
+    'e2e4 g7g6': ('B06', 'Modern Defence'),
+    'e2e4 d7d6': ('B07', 'Pirc Defence'),
+    'd2d4': ('A40', "Queen's Pawn Game"),
+    'd2d4 d7d5': ('D00', "Queen's Pawn Game"),
+    'd2d4 d7d5 c1f4': ('D02', 'London System'),
+    'd2d4 d7d5 c2c4': ('D06', "Queen's Gambit"),
+    'd2d4 d7d5 c2c4 c7c6': ('D10', 'Slav Defence'),
+    'd2d4 d7d5 c2c4 d5c4': ('D20', "Queen's Gambit Accepted"),
+    'd2d4 d7d5 c2c4 e7e6': ('D30', "Queen's Gambit Declined"),
+    'd2d4 g8f6': ('A45', 'Indian Defence'),
+    'd2d4 g8f6 c2c4': ('A50', 'Indian Defence'),
+    'd2d4 g8f6 c2c4 e7e6': ('E00', 'Indian Defence: East Indian'),
+    'd2d4 g8f6 c2c4 e7e6 g1f3 b7b6': ('E12', "Queen's Indian Defence"),
+    'd2d4 g8f6 c2c4 e7e6 b1c3 f8b4': ('E20', 'Nimzo-Indian Defence'),
+    'd2d4 g8f6 c2c4 g7g6': ('E60', "King's Indian Defence"),
+    'd2d4 g8f6 c2c4 g7g6 b1c3 d7d5': ('D80', 'Grunfeld Defence'),
+    'd2d4 f7f5': ('A80', 'Dutch Defence'),
+    'c2c4': ('A10', 'English Opening'),
+    'g1f3': ('A04', 'Zukertort Opening'),
+    'f2f4': ('A02', "Bird's Opening"),
+    'b2b3': ('A01', 'Nimzo-Larsen Attack'),
+    'f2f3': ('A00', 'Barnes Opening'),
+    'f2f3 e7e5 g2g4 d8h4': ('A00', "Fool's Mate"),
+    'a2a4': ('A00', 'Ware Opening'),
+}
+
+MAX_ECO_PLIES = max(len(moves.split()) for moves in ECO_TABLE)
+
+
+def classify(moves):
+    """
+    :param moves: Moves of the game from the starting position
+    :return: (ECO code, opening name), or (None, None) if the opening isn't in ECO_TABLE
+    """
+    found = (None, None)
+    prefix = ''
+    for move in moves[:MAX_ECO_PLIES]:
+        prefix = prefix + ' ' + move.uci() if prefix else move.uci()
+        found = ECO_TABLE.get(prefix, found)
+    return found
+
+
+class PGNArchive:
+    def __init__(self, path='games.pgn', index_path='games.sqlite3'):
+        """
+        Finished games are appended to a single PGN file. The index holds each game's players,
+        date, result and ECO code next to its byte offset, so queries never read the PGN file
+        and fetching a game reads only that game.
+
+        :param path: Path of the PGN archive
+        :param index_path: Path of the sqlite index
+        """
+        self.path = path
+        self.file = open(path, 'ab')
+        self.db = sqlite3.connect(index_path)
+        self.db.execute('CREATE TABLE IF NOT EXISTS games (id INTEGER PRIMARY KEY, offset INTEGER NOT NULL, '
+                        'length INTEGER NOT NULL, white_id INTEGER, black_id INTEGER, white TEXT, black TEXT, '
+                        'date TEXT, result TEXT, eco TEXT)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS games_white ON games (white_id)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS games_black ON games (black_id)')
+        self.db.commit()
+
+    def add(self, board, white_id, black_id, white, black, result=None, date=None, event='Chess Game',
+            site='Discord'):
+        """
+        Archives a finished game.
+
+        :param board: chess.Board at the end of the game
+        :param white_id: ID of the white player, None for the bot
+        :param black_id: ID of the black player, None for the bot
+        :param white: Name of the white player
+        :param black: Name of the black player
+        :param result: Result to record, defaults to the board's result
+        :param date: datetime.date the game was played, defaults to today
+        :return: ID of the archived game
+        """
+        result = result or board.result()
+        date_string = f"{date or datetime.date.today():%Y.%m.%d}"
+        eco, opening = classify(board.move_stack)
+
+        game = chess.pgn.Game.from_board(board)
+        game.headers['Event'] = event
+        game.headers['Site'] = site
+        game.headers['Date'] = date_string
+        game.headers['Round'] = '1'
+        game.headers['White'] = white
+        game.headers['Black'] = black
+        game.headers['Result'] = result
+        if eco is not None:
+            game.headers['ECO'] = eco
+            game.headers['Opening'] = opening
+        data = (str(game) + '\n\n').encode('utf-8')
+
+        # The PGN is on disk before the index points at it, so the index never refers past the end of the file
+        self.file.seek(0, os.SEEK_END)
+        offset = self.file.tell()
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+        cursor = self.db.execute('INSERT INTO games (offset, length, white_id, black_id, white, black, date, result, '
+                                 'eco) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 (offset, len(data), white_id, black_id, white, black, date_string, result, eco))
+        self.db.commit()
+        return cursor.lastrowid
+
+    def pgn(self, game_id):
+        """
+        :param game_id: ID of the game
+        :return: PGN text of the game, or None if there is no such game
+        """
+        row = self.db.execute('SELECT offset, length FROM games WHERE id = ?', (game_id,)).fetchone()
+        if row is None:
+            return None
+        offset, length = row
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length).decode('utf-8').strip()
+
+    def history(self, user_id, start=0, count=10):
+        """
+        :param user_id: ID of the player
+        :param start: Number of the player's most recent games to skip
+        :param count: Number of games to return
+        :return: List of (id, date, white, black, result, eco), most recent first
+        """
+        return self.db.execute('SELECT id, date, white, black, result, eco FROM games '
+                               'WHERE white_id = ? OR black_id = ? ORDER BY id DESC LIMIT ? OFFSET ?',
+                               (user_id, user_id, count, start)).fetchall()
+
+    def stats(self, user_id, openings=3):
+        """
+        :param user_id: ID of the player
+        :param openings: Number of most played openings to list
+        :return: Dict of the player's games, wins, draws and losses, and a list of (eco, games) of their openings
+        """
+        games, wins, draws, losses = self.db.execute(
+            "SELECT COUNT(*), "
+            "COALESCE(SUM((white_id = ?1 AND result = '1-0') OR (black_id = ?1 AND result = '0-1')), 0), "
+            "COALESCE(SUM(result = '1/2-1/2'), 0), "
+            "COALESCE(SUM((white_id = ?1 AND result = '0-1') OR (black_id = ?1 AND result = '1-0')), 0) "
+            "FROM games WHERE white_id = ?1 OR black_id = ?1", (user_id,)).fetchone()
+        eco = self.db.execute('SELECT eco, COUNT(*) FROM games WHERE (white_id = ?1 OR black_id = ?1) '
+                              'AND eco IS NOT NULL GROUP BY eco ORDER BY COUNT(*) DESC LIMIT ?2',
+                              (user_id, openings)).fetchall()
+        return {'games': games, 'wins': wins, 'draws': draws, 'losses': losses, 'openings': eco}
+
+    def close(self):
+        self.file.close()
+        self.db.close()
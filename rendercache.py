@@ -0,0 +1,91 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+RenderCache: Internal module for use in the FionaBot discord bot's chess functions.
+Remembers rendered board images so a position that comes up again isn't drawn again.
+"""
+import collections
+import hashlib
+import os
+
+
+class RenderCache:
+    def __init__(self, renderer, size=512, directory=None):
+        """
+        Sits in front of a boardrender.BoardRenderer and has the same render() method.
+        Images are keyed by piece placement, last move, checked king, orientation and style,
+        kept in an in-memory LRU and optionally in a directory named by the key's hash.
+
+        :param renderer: boardrender.BoardRenderer to draw cache misses with
+        :param size: Maximum number of images kept in memory
+        :param directory: Directory for the disk tier, or None to only cache in memory
+        """
+        self.renderer = renderer
+        self.size = size
+        self.directory = directory
+        self.images = collections.OrderedDict()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.directory is not None:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, board, orientation):
+        lastmove = board.peek().uci() if board.move_stack else None
+        check = board.king(board.turn) if board.is_check() else None
+        return board.board_fen(), lastmove, check, orientation, self.renderer.style
+
+    def path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode('utf-8')).hexdigest() + '.png')
+
+    def remember(self, key, image):
+        self.images[key] = image
+        if len(self.images) > self.size:
+            self.images.popitem(last=False)
+
+    def render(self, board, orientation):
+        """
+        :param board: chess.Board to draw
+        :param orientation: Colour at the bottom of the board
+        :return: PNG bytes
+        """
+        key = self.key(board, orientation)
+        image = self.images.get(key)
+        if image is not None:
+            self.memory_hits += 1
+            self.images.move_to_end(key)
+            return image
+
+        if self.directory is not None:
+            try:
+                with open(self.path(key), 'rb') as f:
+                    image = f.read()
+            except FileNotFoundError:
+                pass
+            else:
+                self.disk_hits += 1
+                self.remember(key, image)
+                return image
+
+        self.misses += 1
+        image = self.renderer.render(board, orientation)
+        self.remember(key, image)
+        if self.directory is not None:
+            temp_path = self.path(key) + '.tmp'
+            with open(temp_path, 'wb') as f:
+                f.write(image)
+            os.replace(temp_path, self.path(key))
+        return image
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'images': len(self.images),
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': '%0.1f%%' % (100 * (lookups - self.misses) / lookups if lookups else 0),
+        }
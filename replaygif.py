@@ -0,0 +1,121 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+ReplayGIF: Internal module for use in the FionaBot discord bot's chess functions.
+Encodes a game as an animated GIF, redrawing only the squares each move changes.
+"""
+import io
+import chess
+from PIL import Image, ImageChops, GifImagePlugin
+
+# Palette index left out of the shared palette, frames use it for pixels the move didn't change
+TRANSPARENT = 255
+
+
+class ReplayEncoder:
+    def __init__(self, renderer, frame_duration=800, final_duration=3000):
+        """
+        Replays are drawn with a boardrender.BoardRenderer's sprites. Every frame after the first only
+        holds the rectangle around the squares the move changed, quantized to one palette shared by
+        the whole GIF, with pixels that are already showing left transparent so they compress to
+        almost nothing. Frames are written out one at a time as they are drawn.
+
+        :param renderer: boardrender.BoardRenderer to draw with
+        :param frame_duration: Milliseconds each move is shown for
+        :param final_duration: Milliseconds the final position is shown for
+        """
+        self.renderer = renderer
+        self.frame_duration = frame_duration
+        self.final_duration = final_duration
+        self.palettes = {}
+
+    def palette(self, orientation):
+        """
+        Builds the shared palette from the background with every piece, both last move
+        highlights and the check overlay drawn on it.
+
+        :param orientation: Colour at the bottom of the board
+        :return: P mode image holding the palette
+        """
+        palette = self.palettes.get(orientation)
+        if palette is None:
+            sample = self.renderer.background(orientation).copy()
+            pieces = [chess.Piece(piece_type, color) for color in chess.COLORS for piece_type in chess.PIECE_TYPES]
+            for square, piece in zip(chess.SQUARES, pieces):
+                self.renderer.draw_square(sample, square, orientation, piece=piece)
+            for square, piece in zip(chess.SQUARES[16:], pieces):
+                self.renderer.draw_square(sample, square, orientation, piece=piece, lastmove=True)
+            self.renderer.draw_square(sample, chess.SQUARES[40], orientation, piece=pieces[5], check=True)
+            self.renderer.draw_square(sample, chess.SQUARES[41], orientation, piece=pieces[11], lastmove=True,
+                                      check=True)
+            palette = sample.convert('RGB').quantize(TRANSPARENT, method=Image.MEDIANCUT)
+            self.palettes[orientation] = palette
+        return palette
+
+    def quantize(self, image, orientation):
+        return image.convert('RGB').quantize(palette=self.palette(orientation), dither=Image.NONE)
+
+    @staticmethod
+    def indices(image):
+        # A P mode image's palette indices as an L mode image, to compare frames without the palette
+        return Image.frombytes('L', image.size, image.tobytes())
+
+    def encode(self, moves, orientation):
+        """
+        :param moves: Moves of the game from the starting position
+        :param orientation: Colour at the bottom of the board
+        :return: GIF bytes
+        """
+        board = chess.Board()
+        frame = self.renderer.render_image(board, orientation)
+        output = io.BytesIO()
+
+        first = self.quantize(frame, orientation)
+        header, _ = GifImagePlugin.getheader(first, info={'loop': 0, 'optimize': False})
+        for chunk in header:
+            output.write(chunk)
+        for chunk in GifImagePlugin.getdata(first, duration=self.final_duration if not moves else self.frame_duration):
+            output.write(chunk)
+        shown = self.indices(first)
+        palette = first.getpalette()
+
+        pieces = board.piece_map()
+        highlighted = set()
+        check = None
+        size = self.renderer.square_size
+        for ply, move in enumerate(moves, 1):
+            board.push(move)
+            new_pieces = board.piece_map()
+            new_highlighted = {move.from_square, move.to_square}
+            new_check = board.king(board.turn) if board.is_check() else None
+
+            dirty = {square for square in pieces.keys() | new_pieces.keys()
+                     if pieces.get(square) != new_pieces.get(square)}
+            dirty |= highlighted | new_highlighted
+            dirty |= {square for square in (check, new_check) if square is not None}
+
+            for square in dirty:
+                self.renderer.draw_square(frame, square, orientation, piece=new_pieces.get(square),
+                                          lastmove=square in new_highlighted, check=square == new_check)
+            origins = [self.renderer.square_origin(square, orientation) for square in dirty]
+            box = (min(x for x, _ in origins), min(y for _, y in origins),
+                   max(x for x, _ in origins) + size, max(y for _, y in origins) + size)
+
+            changed = self.quantize(frame.crop(box), orientation)
+            indices = self.indices(changed)
+            unchanged = ImageChops.difference(indices, shown.crop(box)).point(lambda value: 255 if value == 0 else 0)
+            shown.paste(indices, box[:2])
+            indices.paste(TRANSPARENT, mask=unchanged)
+            changed = Image.frombytes('P', changed.size, indices.tobytes())
+            changed.putpalette(palette)
+
+            duration = self.final_duration if ply == len(moves) else self.frame_duration
+            for chunk in GifImagePlugin.getdata(changed, box[:2], duration=duration, transparency=TRANSPARENT,
+                                                disposal=1):
+                output.write(chunk)
+
+            pieces, highlighted, check = new_pieces, new_highlighted, new_check
+
+        output.write(b';')
+        return output.getvalue()
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+MessageRouter: Internal module for use in the FionaBot discord bot's interactive commands.
+Hands each incoming message straight to the session waiting on its channel and author.
+"""
+import asyncio
+import math
+
+
+class Timer:
+    __slots__ = ('callback', 'rounds')
+
+    def __init__(self, callback, rounds):
+        self.callback = callback
+        self.rounds = rounds
+
+    def cancel(self):
+        self.callback = None
+
+
+class TimerWheel:
+    def __init__(self, resolution=1.0, slots=512):
+        """
+        Hashed timer wheel. Every timer lives in one slot and a single repeating tick
+        fires the slot it lands on, so there is one pending loop callback however many
+        sessions are waiting.
+
+        :param resolution: Seconds per tick
+        :param slots: Number of slots in the wheel
+        """
+        self.resolution = resolution
+        self.slots = [[] for _ in range(slots)]
+        self.position = 0
+        self.count = 0
+        self.loop = None
+        self.handle = None
+        self.next_tick = None
+
+    def schedule(self, delay, callback):
+        """
+        Schedules a callback to run after a delay. The callback never runs early,
+        but may run up to one tick late.
+
+        :param delay: Delay in seconds
+        :param callback: Function to call with no arguments
+        :return: Timer that can be cancelled
+        """
+        ticks = max(1, math.ceil(delay / self.resolution))
+        if self.handle is None:
+            self.loop = asyncio.get_event_loop()
+            self.next_tick = self.loop.time() + self.resolution
+            self.handle = self.loop.call_at(self.next_tick, self.tick)
+        else:
+            # The next tick is less than a full tick away
+            ticks += 1
+
+        timer = Timer(callback, (ticks - 1) // len(self.slots))
+        self.slots[(self.position + ticks) % len(self.slots)].append(timer)
+        self.count += 1
+        return timer
+
+    def tick(self):
+        self.position = (self.position + 1) % len(self.slots)
+        remaining = []
+        for timer in self.slots[self.position]:
+            if timer.callback is None:
+                self.count -= 1
+            elif timer.rounds > 0:
+                timer.rounds -= 1
+                remaining.append(timer)
+            else:
+                self.count -= 1
+                callback, timer.callback = timer.callback, None
+                callback()
+        self.slots[self.position] = remaining
+
+        if self.count > 0:
+            self.next_tick += self.resolution
+            self.handle = self.loop.call_at(self.next_tick, self.tick)
+        else:
+            self.handle = None
+
+
+class MessageRouter:
+    def __init__(self, wheel=None):
+        """
+        Routes messages to sessions keyed by (channel_id, author_id). A channel_id of None
+        waits for the author in any channel.
+
+        :param wheel: TimerWheel used for timeouts
+        """
+        self.wheel = wheel if wheel is not None else TimerWheel()
+        self.waiters = {}
+        self.handlers = {}
+
+    async def wait_for(self, channel, author, timeout=None):
+        """
+        Waits for the next message from an author.
+
+        :param channel: Channel to listen in, or None for any channel
+        :param author: User to listen to
+        :param timeout: Seconds to wait before raising asyncio.TimeoutError
+        :return: The message
+        """
+        key = (channel.id if channel is not None else None, author.id)
+        future = asyncio.get_event_loop().create_future()
+        self.waiters.setdefault(key, []).append(future)
+
+        def expire():
+            if not future.done():
+                future.set_exception(asyncio.TimeoutError())
+
+        timer = self.wheel.schedule(timeout, expire) if timeout is not None else None
+        try:
+            return await future
+        finally:
+            if timer is not None:
+                timer.cancel()
+            futures = self.waiters.get(key)
+            if futures is not None and future in futures:
+                futures.remove(future)
+                if not futures:
+                    del self.waiters[key]
+
+    def subscribe(self, channel_id, author_id, handler):
+        """
+        Hands every later message from an author to a handler until unsubscribed, without
+        anything waiting in between. A coroutine returned by the handler is scheduled as a task.
+
+        :param channel_id: ID of the channel to listen in, or None for any channel
+        :param author_id: ID of the user to listen to
+        :param handler: Function called with each message
+        :return:
+        """
+        self.handlers[(channel_id, author_id)] = handler
+
+    def unsubscribe(self, channel_id, author_id):
+        self.handlers.pop((channel_id, author_id), None)
+
+    def dispatch(self, message):
+        """
+        Hands a message to every session waiting on its channel and author, and to their handler.
+
+        :param message: The incoming message
+        :return: True if any session received it
+        """
+        delivered = False
+        for key in ((message.channel.id, message.author.id), (None, message.author.id)):
+            for future in self.waiters.pop(key, ()):
+                if not future.done():
+                    future.set_result(message)
+                    delivered = True
+            handler = self.handlers.get(key)
+            if handler is not None:
+                result = handler(message)
+                if asyncio.iscoroutine(result):
+                    asyncio.ensure_future(result)
+                delivered = True
+        return delivered
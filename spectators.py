@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+SpectatorHub: Internal module for use in the FionaBot discord bot's chess functions.
+Mirrors running games to spectator channels through a rate limited queue per channel.
+"""
+import asyncio
+import collections
+import io
+import traceback
+from discord import File, Forbidden, HTTPException, NotFound
+
+
+class SpectatorHub:
+    def __init__(self, get_channel, interval=1.0):
+        """
+        Every update is broadcast with the board image its game already rendered, so spectators never
+        cost a render. Each channel has a queue drained by one task that waits interval seconds between
+        sends. While an update for a game is still queued a newer one replaces it, so a busy channel
+        skips straight to the latest position instead of falling behind.
+
+        :param get_channel: Function returning a channel from its ID
+        :param interval: Minimum seconds between two sends to the same channel
+        """
+        self.get_channel = get_channel
+        self.interval = interval
+        self.watchers = {}
+        self.queues = {}
+        self.senders = {}
+
+        self.sent = 0
+        self.coalesced = 0
+
+    def watch(self, game_id, channel_id):
+        self.watchers.setdefault(game_id, set()).add(channel_id)
+
+    def unwatch(self, channel_id, game_id=None):
+        """
+        :param channel_id: ID of the spectating channel
+        :param game_id: ID of the game to stop mirroring, or None for every game
+        :return: Number of games the channel stopped watching
+        """
+        stopped = 0
+        for watched_id in ([game_id] if game_id is not None else list(self.watchers)):
+            channels = self.watchers.get(watched_id)
+            if channels is not None and channel_id in channels:
+                channels.discard(channel_id)
+                stopped += 1
+                if not channels:
+                    del self.watchers[watched_id]
+        return stopped
+
+    def drop(self, game_id):
+        self.watchers.pop(game_id, None)
+
+    def broadcast(self, game_id, content, board=None):
+        """
+        Queues an update of a game for every channel watching it.
+
+        :param game_id: ID of the game
+        :param content: Message text
+        :param board: PNG bytes of the board, shared by every channel
+        :return:
+        """
+        for channel_id in self.watchers.get(game_id, ()):
+            queue = self.queues.setdefault(channel_id, collections.OrderedDict())
+            if game_id in queue:
+                self.coalesced += 1
+                if board is None:
+                    # Text without a board, like the end of the game, is added to the update it would replace
+                    queued_content, queued_board = queue[game_id]
+                    queue[game_id] = (queued_content + '\n' + content, queued_board)
+                    continue
+            queue[game_id] = (content, board)
+            if channel_id not in self.senders:
+                self.senders[channel_id] = asyncio.ensure_future(self.drain(channel_id))
+
+    async def drain(self, channel_id):
+        try:
+            queue = self.queues[channel_id]
+            while queue:
+                game_id, (content, board) = queue.popitem(last=False)
+                channel = self.get_channel(channel_id)
+                if channel is None:
+                    self.unwatch(channel_id)
+                    break
+                file = File(io.BytesIO(board), filename='board.png') if board is not None else None
+                try:
+                    await channel.send(content, file=file)
+                except (Forbidden, NotFound):
+                    self.unwatch(channel_id)
+                    break
+                except HTTPException:
+                    # Only this update is lost, the channel keeps getting the next ones
+                    traceback.print_exc()
+                else:
+                    self.sent += 1
+                await asyncio.sleep(self.interval)
+        finally:
+            self.queues.pop(channel_id, None)
+            del self.senders[channel_id]
+
+    def stats(self):
+        return {
+            'games': len(self.watchers),
+            'channels': len({channel_id for channels in self.watchers.values() for channel_id in channels}),
+            'queued': sum(len(queue) for queue in self.queues.values()),
+            'sent': self.sent,
+            'coalesced': self.coalesced,
+        }
+
+    def close(self):
+        for sender in list(self.senders.values()):
+            sender.cancel()
@@ -12,6 +12,8 @@ cd /home/spamsuckersunited/FinBot
 
 pip install -r requirements.txt
 
+[ -f waifus.pack ] || python3 waifupack.py waifugen/results-fionabot waifus.pack
+
 chown +x stockfish_10_x64_modern
 chown +x main.py
 
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+Tablebase: Internal module for use in the FionaBot discord bot's chess functions.
+Answers endgame positions from local Syzygy tables instead of searching them.
+"""
+import chess
+import chess.syzygy
+
+
+class Tablebase:
+    def __init__(self, directory):
+        """
+        Syzygy WDL and DTZ tables from a directory. Positions with few enough pieces and no
+        castling rights are ranked move by move from the tables, without an engine.
+
+        :param directory: Directory holding the .rtbw and .rtbz files
+        """
+        self.directory = directory
+        self.tables = chess.syzygy.open_tablebase(directory)
+        # Table keys look like KQvK, so a key's length is its piece count plus the 'v'
+        self.max_pieces = max((len(key) - 1 for key in self.tables.wdl), default=0)
+
+        self.probes = 0
+        self.failures = 0
+
+    def covers(self, board):
+        """
+        :param board: Position to check
+        :return: True if the tables could hold the position
+        """
+        return chess.popcount(board.occupied) <= self.max_pieces and not board.castling_rights
+
+    def rank_moves(self, board):
+        """
+        Ranks every legal move by the outcome the tables give for the position after it.
+        Wins come first, quickest first, then draws, then losses, slowest first.
+
+        :param board: Position to rank the moves of
+        :return: List of moves from best to worst, or None if a table is missing
+        """
+        self.probes += 1
+        keys = {}
+        board = board.copy(stack=False)
+        for move in board.legal_moves:
+            board.push(move)
+            # Both are from the opponent's point of view after the move
+            wdl = self.tables.get_wdl(board)
+            dtz = self.tables.get_dtz(board, 0)
+            board.pop()
+            if wdl is None:
+                self.failures += 1
+                return None
+            keys[move] = (-wdl, dtz)
+        return sorted(keys, key=keys.get, reverse=True)
+
+    def stats(self):
+        return {
+            'directory': self.directory,
+            'max_pieces': self.max_pieces,
+            'probes': self.probes,
+            'missing_tables': self.failures,
+        }
+
+    def close(self):
+        self.tables.close()
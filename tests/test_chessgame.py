@@ -0,0 +1,58 @@
+import asyncio
+import os
+
+import pytest
+
+chess = pytest.importorskip('chess')
+import chess.engine
+
+import enginepool
+
+if not os.access(enginepool.STOCKFISH_PATH, os.X_OK):
+    pytest.skip('bundled Stockfish is not executable here', allow_module_level=True)
+
+import chessgame
+
+
+def test_immediate_ponder_miss():
+    async def run():
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        pool = enginepool.EnginePool(size=1, spare=0)
+        try:
+            for _ in range(5):
+                game = chessgame.ChessGame(engines=pool, limit=chess.engine.Limit(depth=6), ponder=True)
+                game.board.push_uci('e2e4')
+                game.ponder_move = chess.Move.from_uci('e7e5')
+                game.start_pondering()
+                # Miss before the ponder search has had a chance to start
+                game.player_move('c7c5')
+                await game.ai_move()
+                assert game.ponder_task is None
+                assert len(game.board.move_stack) == 3
+            assert pool.crashes == 0
+            assert pool.total == 1
+        finally:
+            await pool.close()
+        return errors
+
+    assert asyncio.run(run()) == []
+
+
+def test_close_before_ponder_starts():
+    async def run():
+        pool = enginepool.EnginePool(size=1, spare=0)
+        try:
+            game = chessgame.ChessGame(engines=pool, limit=chess.engine.Limit(depth=6), ponder=True)
+            game.board.push_uci('e2e4')
+            game.ponder_move = chess.Move.from_uci('e7e5')
+            game.start_pondering()
+            task = game.ponder_task
+            game.close()
+            await task
+            assert pool.crashes == 0
+            assert len(pool.idle) == 1
+        finally:
+            await pool.close()
+
+    asyncio.run(run())
@@ -0,0 +1,37 @@
+import pytest
+
+pytest.importorskip('fuzzywuzzy')
+
+import tio
+
+
+def catalogue(tmp_path, names):
+    languages = tio.LanguageCatalogue(None, str(tmp_path / 'tio_languages.json'))
+    languages.set_languages({lang: {'name': name} for lang, name in names.items()})
+    return languages
+
+
+def test_search_finds_one_letter_language(tmp_path):
+    languages = catalogue(tmp_path, {'r': 'R', 'rust': 'Rust', 'java-openjdk': 'Java (OpenJDK 8)'})
+    assert 'r' in languages.search('Rscript')
+
+
+def test_search_matches_full_scan(tmp_path):
+    languages = catalogue(tmp_path, {'r': 'R', 'j': 'J', 'k-ngn': 'K (ngn/k)', 'rust': 'Rust',
+                                     'python3': 'Python 3', 'javascript-node': 'JavaScript (Node.js)'})
+    for query in ('R', 'Rust', 'python', 'Python 3', 'JavaScript', 'J', 'k'):
+        full = {lang: info['name'] for lang, info in languages.languages.items()
+                if tio.fuzz.partial_ratio(info['name'], query) > 75}
+        assert languages.search(query) == full
+
+
+def test_search_long_queries_match_full_scan(tmp_path):
+    languages = catalogue(tmp_path, {'lua': 'Lua', 'rust': 'Rust', 'java-openjdk': 'Java (OpenJDK 8)',
+                                     'java-jdk': 'Java (JDK)', 'julia': 'Julia', 'python3': 'Python 3',
+                                     'haskell': 'Haskell', 'apl': 'APL', 'r': 'R'})
+    for query in ('Lua 5.3 interpreter', 'Rust nightly 2020', 'Java (OpenJDK 9)', 'Julie language',
+                  'Python 3.8 with numpy', 'Haskel compiler (GHC)', 'Sift AL'):
+        full = {lang: info['name'] for lang, info in languages.languages.items()
+                if tio.fuzz.partial_ratio(info['name'], query) > 75}
+        assert full
+        assert languages.search(query) == full
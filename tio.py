@@ -0,0 +1,311 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+TIO: Internal module for use in the FionaBot discord bot's code commands.
+Talks to tio.run and keeps its language list cached and indexed.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+import zlib
+from fuzzywuzzy import fuzz
+
+LANGUAGES_URL = 'https://tio.run/languages.json'
+RUN_URL = 'https://tio.run/cgi-bin/static/fb67788fd3d1ebf92e66b295525335af-run'
+
+# Writes smaller than this are batched before being handed to the compressor
+CHUNK_SIZE = 64 * 1024
+
+
+def bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+class LanguageCatalogue:
+    def __init__(self, http, cache_path='tio_languages.json', ttl=24 * 60 * 60):
+        """
+        TIO's language list, cached in memory and on disk. Once the cache is older than ttl it is
+        still served while it is revalidated in the background with If-None-Match/If-Modified-Since.
+
+        :param http: webclient.HttpClient to fetch with
+        :param cache_path: Path of the on-disk copy
+        :param ttl: Seconds before the list is revalidated
+        """
+        self.http = http
+        self.cache_path = cache_path
+        self.ttl = ttl
+        self.languages = None
+        self.etag = None
+        self.last_modified = None
+        self.fetched = 0
+        self.index = {}
+        self.grams = {}
+        self.short = set()
+        self.refresh_task = None
+
+        try:
+            with open(self.cache_path, 'r') as f:
+                cached = json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+        else:
+            self.etag = cached.get('etag')
+            self.last_modified = cached.get('last_modified')
+            self.fetched = cached.get('fetched', 0)
+            self.set_languages(cached['languages'])
+
+    def set_languages(self, languages):
+        """
+        Replaces the language list and rebuilds the bigram index of lowercased names. Names too
+        short to be sure to share a bigram with a query they match, such as R or APL, are kept aside
+        instead.
+
+        :param languages: Dict of language ID to language info, as returned by TIO
+        :return:
+        """
+        self.languages = languages
+        self.index = {}
+        self.grams = {}
+        self.short = set()
+        for lang, info in languages.items():
+            if len(info['name']) < 4:
+                self.short.add(lang)
+            grams = bigrams(info['name'].lower())
+            self.grams[lang] = len(grams)
+            for gram in grams:
+                self.index.setdefault(gram, set()).add(lang)
+
+    def save(self):
+        directory = os.path.dirname(os.path.abspath(self.cache_path))
+        fd, temp_path = tempfile.mkstemp(prefix='.tio-', suffix='.json', dir=directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'etag': self.etag, 'last_modified': self.last_modified, 'fetched': self.fetched,
+                       'languages': self.languages}, f)
+        os.replace(temp_path, self.cache_path)
+
+    async def refresh(self):
+        """
+        Fetches the language list, or just confirms the cached copy is current.
+
+        :return:
+        """
+        headers = {}
+        if self.languages is not None:
+            if self.etag:
+                headers['If-None-Match'] = self.etag
+            if self.last_modified:
+                headers['If-Modified-Since'] = self.last_modified
+
+        async with self.http.get(LANGUAGES_URL, headers=headers) as response:
+            if response.status == 200:
+                self.set_languages(json.loads(await response.text()))
+                self.etag = response.headers.get('ETag')
+                self.last_modified = response.headers.get('Last-Modified')
+            elif response.status != 304:
+                return
+        self.fetched = time.time()
+        self.save()
+
+    async def refresh_quietly(self):
+        try:
+            await self.refresh()
+        except Exception:
+            pass
+        finally:
+            self.refresh_task = None
+
+    async def get(self):
+        """
+        :return: Dict of language ID to language info, or None if it has never been fetched successfully
+        """
+        if self.languages is None:
+            # A failed first fetch leaves the list unknown, callers then skip checking languages
+            await self.refresh_quietly()
+        elif time.time() - self.fetched > self.ttl and self.refresh_task is None:
+            self.refresh_task = asyncio.ensure_future(self.refresh_quietly())
+        return self.languages
+
+    def search(self, query, threshold=75):
+        """
+        Fuzzy searches language names. Only languages sharing enough bigrams with the query,
+        and those with names of three characters or fewer, are scored rather than every language
+        TIO has. Queries that short are scored against every language.
+
+        :param query: Language name to search for
+        :param threshold: Minimum fuzz.partial_ratio score
+        :return: Dict of language ID to name
+        """
+        query_grams = bigrams(query.lower())
+        if len(query) >= 4:
+            overlaps = {}
+            for gram in query_grams:
+                for lang in self.index.get(gram, ()):
+                    overlaps[lang] = overlaps.get(lang, 0) + 1
+            # partial_ratio matches the shorter string against the longer, so the overlap needed is
+            # bounded by whichever of the query and the name has fewer bigrams
+            candidates = {lang for lang, overlap in overlaps.items()
+                          if overlap >= max(1, min(len(query_grams), self.grams[lang]) // 4)} | self.short
+        else:
+            candidates = list(self.languages)
+
+        return {lang: self.languages[lang]['name'] for lang in sorted(candidates)
+                if fuzz.partial_ratio(self.languages[lang]['name'], query) > threshold}
+
+
+class TIOSerializer:
+    def __init__(self, level=9):
+        """
+        Builds a TIO run request. Everything written goes through a raw deflate compressor as it
+        arrives, so the uncompressed request is never held in one piece.
+
+        :param level: zlib compression level
+        """
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        self.buffer = bytearray()
+        self.output = bytearray()
+
+    def write(self, data):
+        if len(data) >= CHUNK_SIZE:
+            self.flush_buffer()
+            self.output += self.compressor.compress(data)
+        else:
+            self.buffer += data
+            if len(self.buffer) >= CHUNK_SIZE:
+                self.flush_buffer()
+
+    def flush_buffer(self):
+        if self.buffer:
+            self.output += self.compressor.compress(self.buffer)
+            self.buffer.clear()
+
+    def add_variable(self, name, contents: list):
+        self.write(b'V' + name.encode('utf-8') + b'\0' + str(len(contents)).encode('utf-8') + b'\0')
+
+        for var in contents:
+            self.write(var.encode('utf-8') + b'\0')
+
+    def add_file(self, name, contents: str):
+        contents = contents.encode('utf-8')
+        self.write(b'F' + name.encode('utf-8') + b'\0' + str(len(contents)).encode('utf-8') + b'\0')
+        self.write(contents)
+
+    def add_run(self):
+        self.write(b'R')
+
+    def add_lang(self, language):
+        self.add_variable('lang', [language])
+
+    def add_code(self, code):
+        self.add_file('.code.tio', code)
+
+    def add_input(self, contents):
+        self.add_file('.input.tio', contents)
+
+    def add_args(self, args):
+        self.add_variable('args', args)
+
+    def dump(self):
+        """
+        Finishes the request. Can only be called once.
+
+        :return: The raw deflate compressed request
+        """
+        self.flush_buffer()
+        self.output += self.compressor.flush()
+        return self.output
+
+
+class TIOResponseParser:
+    def __init__(self, piece_limit=2000):
+        """
+        Incrementally inflates a TIO response and splits it on its separator as chunks arrive.
+        The response is gzip framed. The 10 byte header is skipped and the rest is inflated as
+        raw deflate, the same way main.inflate does it. The first 16 bytes of the inflated data
+        are the separator between output pieces.
+
+        :param piece_limit: Bytes kept per piece, anything past it is counted but dropped
+        """
+        self.piece_limit = piece_limit
+        self.inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+        self.header_left = 10
+        self.separator = None
+        self.pending = bytearray()
+        self.piece = bytearray()
+        self.piece_length = 0
+        self.pieces = []
+        self.truncated = False
+
+    def feed(self, chunk):
+        if self.header_left:
+            skipped = min(self.header_left, len(chunk))
+            self.header_left -= skipped
+            chunk = chunk[skipped:]
+        if chunk and not self.inflater.eof:
+            self.parse(self.inflater.decompress(chunk))
+
+    def parse(self, data):
+        self.pending += data
+        if self.separator is None:
+            if len(self.pending) < 16:
+                return
+            self.separator = bytes(self.pending[:16])
+            del self.pending[:16]
+
+        while True:
+            index = self.pending.find(self.separator)
+            if index == -1:
+                break
+            self.extend_piece(self.pending[:index])
+            self.end_piece()
+            del self.pending[:index + 16]
+
+        # Keep enough of the tail to find a separator split across chunks
+        keep = len(self.separator) - 1
+        if len(self.pending) > keep:
+            self.extend_piece(self.pending[:len(self.pending) - keep])
+            del self.pending[:len(self.pending) - keep]
+
+    def extend_piece(self, data):
+        room = self.piece_limit - len(self.piece)
+        if room > 0:
+            self.piece += data[:room]
+        if len(data) > room:
+            self.truncated = True
+        self.piece_length += len(data)
+
+    def end_piece(self):
+        if self.piece_length:
+            self.pieces.append(self.piece.decode('utf-8', errors='replace'))
+        self.piece = bytearray()
+        self.piece_length = 0
+
+    def finish(self):
+        """
+        :return: List of the decoded output pieces
+        """
+        self.parse(self.inflater.flush())
+        if self.separator is None:
+            self.separator = b''
+        self.extend_piece(self.pending)
+        self.pending.clear()
+        self.end_piece()
+        return self.pieces
+
+
+async def run(http, serializer, timeout=120):
+    """
+    Sends a run request to TIO and streams the response through a TIOResponseParser.
+
+    :param http: webclient.HttpClient to send the request with
+    :param serializer: TIOSerializer holding the request
+    :param timeout: Total timeout in seconds
+    :return: List of output pieces
+    """
+    parser = TIOResponseParser()
+    async with http.post(RUN_URL, data=serializer.dump(), timeout=timeout) as response:
+        async for chunk in response.content.iter_any():
+            parser.feed(chunk)
+    return parser.finish()
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+Triggers: Internal module for use in the FionaBot discord bot's auto-responses.
+Compiles every trigger phrase into one Aho-Corasick automaton so a message is scanned once.
+
+A trigger is a dict with the keys:
+    phrase: Text to look for, matched case-insensitively
+    match: 'contains' to match anywhere in the message, 'exact' to match the whole message
+    response: Text to send back
+    file: Optional file to attach
+    action: Optional special action, currently only 'mention_random'
+"""
+from collections import deque
+
+DEFAULT_TRIGGERS = [
+    {'phrase': 'seduce', 'match': 'contains', 'response': 'Seduce me!', 'file': 'seduce.png'},
+    {'phrase': 'mirage', 'match': 'exact', 'response': 'now dont get me started on the mirage 2000 hahah its so bad like wtf french the best plane they ever made was a flag blown away by the wind it works great actualy but the mirage is so ugly i dont enven now how it can even fly i know a friend is part of the raf he flew three (yes, 3) mirage and the worst was the deux mille i mean its a flying pankace and really how can a french plane work anyway they dont even now how cars work look at renault its so bad right so yes the mirage is pretty shitty right yeah'},
+    {'phrase': 'thatsthejoke.jpg', 'match': 'exact', 'response': 'THATS THE JOKE', 'file': 'thatsthejoke.gif'},
+] + [
+    {'phrase': phrase, 'match': 'exact', 'response': 'Everything is Fine!', 'file': 'Z.png'}
+    for phrase in ['it\'s fine', 'its fine', 'i\'m fine', 'im fine', 'i am fine']
+] + [
+    {'phrase': '@someone', 'match': 'exact', 'response': None, 'action': 'mention_random'},
+]
+
+
+class TriggerSet:
+    def __init__(self, triggers):
+        """
+        A compiled list of triggers.
+
+        :param triggers: List of trigger dicts
+        """
+        self.triggers = triggers
+        self.exact = {}
+
+        # Aho-Corasick automaton: goto transitions, failure links and the triggers ending at each state
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for index, trigger in enumerate(triggers):
+            phrase = trigger['phrase'].lower()
+            if trigger.get('match', 'contains') == 'exact':
+                self.exact.setdefault(phrase, []).append(index)
+                continue
+            state = 0
+            for char in phrase:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.output[state].append(index)
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def match(self, text):
+        """
+        Finds every trigger in an already lowercased message.
+
+        :param text: Lowercased message content
+        :return: List of matching triggers, each at most once, in the order they were defined
+        """
+        found = set(self.exact.get(text, ()))
+
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found.update(output[state])
+
+        return [self.triggers[index] for index in sorted(found)]
+
+
+class TriggerEngine:
+    def __init__(self, triggers=None, guild_triggers=None):
+        """
+        Global triggers plus extra triggers for individual guilds. Each guild gets a single
+        automaton covering both, compiled the first time it is needed.
+
+        :param triggers: List of trigger dicts used everywhere
+        :param guild_triggers: Dict of guild ID to a list of extra trigger dicts
+        """
+        self.triggers = triggers if triggers is not None else DEFAULT_TRIGGERS
+        self.guild_triggers = guild_triggers if guild_triggers is not None else {}
+        self.compiled = {}
+
+    def files(self):
+        """
+        :return: Set of every file attached by any trigger
+        """
+        every_trigger = self.triggers + [trigger for extra in self.guild_triggers.values() for trigger in extra]
+        return {trigger['file'] for trigger in every_trigger if trigger.get('file')}
+
+    def match(self, guild_id, content):
+        """
+        :param guild_id: ID of the guild the message was sent in, or None
+        :param content: Message content
+        :return: List of matching triggers
+        """
+        trigger_set = self.compiled.get(guild_id)
+        if trigger_set is None:
+            trigger_set = TriggerSet(self.triggers + self.guild_triggers.get(guild_id, []))
+            self.compiled[guild_id] = trigger_set
+        return trigger_set.match(content.lower())
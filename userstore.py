@@ -0,0 +1,110 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+UserStore: Internal module for use in the FionaBot discord bot's leveling system.
+Keeps users.json in memory and writes it back in the background.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import traceback
+
+
+class UserStore:
+    def __init__(self, path='users.json', flush_interval=60):
+        """
+        In-memory copy of the leveling data. Changes are marked dirty and written out periodically.
+
+        :param path: Path of the JSON file backing the store
+        :param flush_interval: Seconds between background flushes
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.dirty = set()
+        self.flush_task = None
+
+        try:
+            with open(self.path, 'r') as f:
+                self.users = json.load(f)
+        except FileNotFoundError:
+            self.users = {}
+
+    def __contains__(self, user_id):
+        return user_id in self.users
+
+    def __getitem__(self, user_id):
+        return self.users[user_id]
+
+    def __setitem__(self, user_id, record):
+        self.users[user_id] = record
+        self.dirty.add(user_id)
+
+    def get(self, user_id, default=None):
+        return self.users.get(user_id, default)
+
+    def mark_dirty(self, user_id):
+        """
+        Marks a record as changed so that the next flush writes it out.
+
+        :param user_id: Key of the changed record
+        :return:
+        """
+        self.dirty.add(user_id)
+
+    def flush(self):
+        """
+        Writes a snapshot of every record to disk if anything changed since the last flush.
+        The snapshot goes to a temporary file which is then renamed over the old one,
+        so a crash mid-write never leaves a truncated users.json behind. Records only stop
+        being dirty once the write succeeded, so a failed flush is retried by the next one.
+
+        :return: True if anything was written
+        """
+        if not self.dirty:
+            return False
+
+        written = set(self.dirty)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(prefix='.users-', suffix='.json', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.users, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.dirty -= written
+        return True
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self, loop):
+        """
+        Starts the background flush task if it isn't already running.
+
+        :param loop: Event loop to run the task on
+        :return:
+        """
+        if self.flush_task is None:
+            self.flush_task = loop.create_task(self.flush_periodically())
+
+    def stop(self):
+        """
+        Stops the background flush task and writes out anything still pending.
+
+        :return:
+        """
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        self.flush()
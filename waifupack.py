@@ -0,0 +1,145 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+WaifuPack: Internal module for use in the FionaBot discord bot's waifu gallery.
+Packs the generated images into a single file and serves them from a memory map.
+
+Pack layout, all little-endian:
+    header: 8 byte magic, uint32 image count
+    index: one (uint64 offset, uint32 length) entry per image ID, length 0 if missing
+    data: the image files back to back
+
+Build a pack with:
+    python3 waifupack.py waifugen/results-fionabot waifus.pack
+"""
+import io
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+HEADER = struct.Struct('<8sI')
+ENTRY = struct.Struct('<QI')
+MAGIC = b'FBWAIFU1'
+FILENAME = 'finbot-waifu-%s.jpg'
+
+
+def build(directory, out_path, count=12000):
+    """
+    Builds a pack out of a directory of finbot-waifu-<id>.jpg files.
+
+    :param directory: Directory containing the images
+    :param out_path: Path to write the pack to
+    :param count: Number of image IDs, starting at 0
+    :return: Number of images packed
+    """
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    fd, temp_path = tempfile.mkstemp(prefix='.waifus-', suffix='.pack', dir=out_dir)
+    packed = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            index = bytearray(ENTRY.size * count)
+            offset = HEADER.size + len(index)
+            out.write(HEADER.pack(MAGIC, count))
+            out.write(index)
+            for waifu_id in range(count):
+                try:
+                    with open(os.path.join(directory, FILENAME % waifu_id), 'rb') as f:
+                        data = f.read()
+                except FileNotFoundError:
+                    continue
+                out.write(data)
+                ENTRY.pack_into(index, ENTRY.size * waifu_id, offset, len(data))
+                offset += len(data)
+                packed += 1
+            out.seek(HEADER.size)
+            out.write(index)
+        os.replace(temp_path, out_path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+    return packed
+
+
+class MemoryViewReader(io.RawIOBase):
+    def __init__(self, view):
+        """
+        Read-only file object over a memoryview, so a slice of the pack can be handed
+        to discord.File without copying it into a BytesIO first.
+
+        :param view: memoryview to read from
+        """
+        super().__init__()
+        self.view = view
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = min(len(buffer), len(self.view) - self.position)
+        buffer[:count] = self.view[self.position:self.position + count]
+        self.position += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        else:
+            self.position = len(self.view) + offset
+        self.position = max(0, min(self.position, len(self.view)))
+        return self.position
+
+    def tell(self):
+        return self.position
+
+
+class WaifuPack:
+    def __init__(self, path):
+        """
+        Memory maps a pack built by build().
+
+        :param path: Path of the pack
+        """
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        magic, self.count = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError('%s is not a waifu pack' % path)
+
+    def __len__(self):
+        return self.count
+
+    def get(self, waifu_id):
+        """
+        :param waifu_id: ID of the image
+        :return: memoryview of the image's bytes inside the pack
+        """
+        if not 0 <= waifu_id < self.count:
+            raise KeyError(waifu_id)
+        offset, length = ENTRY.unpack_from(self.map, HEADER.size + ENTRY.size * waifu_id)
+        if length == 0:
+            raise KeyError(waifu_id)
+        return self.view[offset:offset + length]
+
+    def open(self, waifu_id):
+        """
+        :param waifu_id: ID of the image
+        :return: File object reading the image straight out of the pack
+        """
+        return MemoryViewReader(self.get(waifu_id))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        sys.stderr.write('Usage: %s <image directory> <output pack>\n' % sys.argv[0])
+        sys.exit(1)
+    sys.stdout.write('Packed %s images\n' % build(sys.argv[1], sys.argv[2]))
@@ -0,0 +1,102 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+HttpClient: Internal module for use in the FionaBot discord bot's web requests.
+One pooled aiohttp session shared by every command.
+"""
+import asyncio
+import contextlib
+import urllib.parse
+import aiohttp
+
+
+class HttpClient:
+    def __init__(self, limit=100, limit_per_host=10, dns_ttl=300, keepalive_timeout=30, timeout=30):
+        """
+        Shared HTTP client. Connections are kept alive and reused, DNS lookups are cached,
+        and every request gets a timeout.
+
+        :param limit: Maximum number of open connections in total
+        :param limit_per_host: Maximum number of open connections to a single host
+        :param dns_ttl: Seconds to cache DNS lookups for
+        :param keepalive_timeout: Seconds to keep an idle connection open
+        :param timeout: Default total timeout per request in seconds
+        """
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+
+        self.requests = 0
+        self.failures = 0
+        self.active = 0
+        self.peak_active = 0
+        self.hosts = {}
+
+    def get_session(self):
+        # The session has to be created inside the running event loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             use_dns_cache=True, ttl_dns_cache=self.dns_ttl,
+                                             keepalive_timeout=self.keepalive_timeout)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self.session
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, url, timeout=None, **kwargs):
+        """
+        Makes a request through the shared session.
+
+        :param method: HTTP method
+        :param url: URL to request
+        :param timeout: Total timeout in seconds, defaults to the client's timeout
+        :param kwargs: Passed on to aiohttp.ClientSession.request
+        :return: Async context manager yielding the aiohttp.ClientResponse
+        """
+        host = urllib.parse.urlsplit(url).hostname
+        if timeout is not None:
+            kwargs['timeout'] = aiohttp.ClientTimeout(total=timeout)
+
+        self.requests += 1
+        self.active += 1
+        self.peak_active = max(self.peak_active, self.active)
+        self.hosts[host] = self.hosts.get(host, 0) + 1
+        try:
+            async with self.get_session().request(method, url, **kwargs) as response:
+                yield response
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.failures += 1
+            raise
+        finally:
+            self.active -= 1
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        """
+        :return: Dict of request counters and connection pool usage
+        """
+        connector = self.session.connector if self.session is not None and not self.session.closed else None
+        return {
+            'requests': self.requests,
+            'failures': self.failures,
+            'active': self.active,
+            'peak_active': self.peak_active,
+            'limit': self.limit,
+            'limit_per_host': self.limit_per_host,
+            # aiohttp has no public API for idle pooled connections
+            'pooled_connections': sum(len(conns) for conns in getattr(connector, '_conns', {}).values()),
+            'hosts': dict(self.hosts),
+        }
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
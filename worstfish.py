@@ -9,32 +9,117 @@ DoneOpening = 3
 
 
 class WorstFish:
-    def __init__(self, engine):
-        #self.engine = chess.engine.SimpleEngine.popen_uci("./stockfish-10-win/Windows/stockfish_10_x64_bmi2.exe")
-        self.engine = engine
+    def __init__(self, engines, limit=None, rank=1, multipv=True, cache=None, cache_depth=8, tablebase=None):
+        """
+        :param engines: enginepool.EnginePool to lease engines from
+        :param limit: chess.engine.Limit for the whole ranking search, eg. a total time or node budget
+        :param rank: Which move to play counting from the worst, 1 for the worst move, 2 for the second worst...
+        :param multipv: Rank every move in one MultiPV search instead of analysing each move separately
+        :param cache: evalcache.EvalCache to reuse evaluations of the positions after each move from
+        :param cache_depth: Minimum depth of the cached evaluations to rank from instead of searching
+        :param tablebase: tablebase.Tablebase to rank endgame moves from instead of searching
+        """
+        self.engines = engines
+        self.cache = cache
+        self.cache_depth = cache_depth
+        self.tablebase = tablebase
+        self.limit = limit if limit is not None else chess.engine.Limit(time=1.0)
+        self.rank = rank
+        self.multipv = multipv
         self.opening_status = NotOpening
         self.opening_type = None
 
-    def _get_worst_move(self, board):
-        ai_color = board.turn
-
+    async def _score_moves_multipv(self, board):
+        """
+        Scores every legal move with a single MultiPV search, one principal variation per move.
+
+        :param board: Position to score the moves of
+        :return: Dict of move to chess.engine.PovScore
+        """
+        move_count = board.legal_moves.count()
+        async with self.engines.lease() as engine:
+            infos = await engine.analyse(board, self.limit, multipv=move_count,
+                                         info=chess.engine.INFO_SCORE | chess.engine.INFO_PV)
+
+        move_scores = {info["pv"][0]: info["score"] for info in infos if info.get("pv") and "score" in info}
+
+        if self.cache is not None:
+            # Each line is a search of the position after its first move, one ply shallower
+            board = board.copy()
+            for info in infos:
+                if info.get("pv") and "score" in info and "depth" in info:
+                    if info.get("multipv", 1) == 1:
+                        self.cache.put(board, info["score"], info["depth"], info["pv"][0])
+                    board.push(info["pv"][0])
+                    self.cache.put(board, info["score"], info["depth"] - 1,
+                                   info["pv"][1] if len(info["pv"]) > 1 else None)
+                    board.pop()
+
+        return move_scores
+
+    def _score_moves_from_cache(self, board):
+        """
+        Scores every legal move from cached evaluations of the positions after them.
+
+        :param board: Position to score the moves of
+        :return: Dict of move to chess.engine.PovScore, or None unless every move is cached deep enough
+        """
         move_scores = {}
-
+        board = board.copy()
         for move in board.legal_moves:
             board.push(move)
-            board_score = self.engine.analyse(board, chess.engine.Limit(time=0.75), info=chess.engine.INFO_ALL)
-            move_scores[move] = board_score["score"].white()
+            cached = self.cache.get(board, self.cache_depth - 1)
             board.pop()
+            if cached is None:
+                return None
+            move_scores[move] = cached.score
+        return move_scores
+
+    async def _score_moves_individually(self, board):
+        """
+        Scores every legal move with a separate search of the position after it.
+
+        :param board: Position to score the moves of
+        :return: Dict of move to chess.engine.PovScore
+        """
+        move_scores = {}
 
-        if ai_color == WHITE:
-            # Find the move that is most detrimental to the AI's chance of winning
-            best_move = min(move_scores, key=move_scores.get)
-        else:
-            best_move = max(move_scores, key=move_scores.get)
+        board = board.copy()
+        async with self.engines.lease() as engine:
+            for move in board.legal_moves:
+                board.push(move)
+                board_score = await engine.analyse(board, chess.engine.Limit(time=0.75), info=chess.engine.INFO_ALL)
+                move_scores[move] = board_score["score"]
+                board.pop()
+
+        return move_scores
+
+    async def _get_worst_move(self, board):
+        ai_color = board.turn
+
+        if self.tablebase is not None and self.tablebase.covers(board):
+            ranked = self.tablebase.rank_moves(board)
+            if ranked:
+                return ranked[-min(self.rank, len(ranked))]
+
+        move_scores = None
+        if self.cache is not None:
+            move_scores = self._score_moves_from_cache(board)
+
+        if move_scores is None:
+            if self.multipv:
+                move_scores = await self._score_moves_multipv(board)
+            else:
+                move_scores = await self._score_moves_individually(board)
+
+        if not move_scores:
+            return next(iter(board.legal_moves))
 
-        return best_move
+        # Most detrimental to the AI's chance of winning first
+        ranked = sorted(move_scores, key=lambda move: move_scores[move].pov(ai_color))
+        return ranked[min(self.rank, len(ranked)) - 1]
 
-    def _get_opening_move(self, board):
+    async def _get_opening_move(self, board):
         ai_color = board.turn
 
         moves = self.opening_type.split()
@@ -46,14 +131,14 @@ class WorstFish:
             move = chess.Move.from_uci(playable_moves[board.fullmove_number - 1])
         except:
             self.opening_status = DoneOpening
-            return self._get_worst_move(board)
+            return await self._get_worst_move(board)
         else:
             if move in board.legal_moves:
                 return move
             else:
-                return self._get_worst_move(board)
+                return await self._get_worst_move(board)
 
-    def get_move(self, board=None):
+    async def get_move(self, board=None):
         if board is None:
             board = chess.Board()
 
@@ -68,10 +153,10 @@ class WorstFish:
                 )
 
         if self.opening_status == Opening:
-            return self._get_opening_move(board)
+            return await self._get_opening_move(board)
 
         else:
-            return self._get_worst_move(board)
+            return await self._get_worst_move(board)
 
 
 # Openings starting from white
@@ -0,0 +1,256 @@
+#!/usr/bin/python3
+# encoding: utf-8
+
+"""
+XPJournal: Internal module for use in the FionaBot discord bot's leveling system.
+Records every XP grant in an append-only journal and keeps weekly/monthly leaderboards from it.
+"""
+import asyncio
+import json
+import os
+import struct
+import tempfile
+import time
+import traceback
+import leaderboard
+
+HEADER = struct.Struct('<4sI')  # magic, generation
+RECORD = struct.Struct('<dQQi')  # timestamp, guild id, user id, amount
+MAGIC = b'FBXJ'
+DAY = 86400
+
+
+class XPJournal:
+    def __init__(self, path='xp.journal', snapshot_path='xp.snapshot.json', windows=None,
+                 flush_interval=60, compact_size=4 * 1024 * 1024):
+        """
+        Append-only journal of (timestamp, guild, user, amount) records with rolling-window totals.
+        Grants are bucketed by day so windows only ever add the new grant and subtract the day
+        that falls out of them. Snapshots of the buckets let the journal be truncated.
+
+        :param path: Path of the binary journal
+        :param snapshot_path: Path of the JSON snapshot written on compaction
+        :param windows: Dict of window name to length in days
+        :param flush_interval: Seconds between background fsyncs
+        :param compact_size: Journal size in bytes at which it gets compacted into a snapshot
+        """
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.windows = windows if windows is not None else {'week': 7, 'month': 30}
+        self.flush_interval = flush_interval
+        self.compact_size = compact_size
+        self.flush_task = None
+
+        self.generation = 0
+        self.day = None
+        self.buckets = {}
+        self.rankings = {name: {} for name in self.windows}
+        self.file = None
+        self.dirty = False
+
+        self.load()
+
+    def load(self):
+        """
+        Rebuilds the window totals from the last snapshot plus everything journaled after it.
+
+        :return:
+        """
+        offset = HEADER.size
+        try:
+            with open(self.snapshot_path, 'r') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            pass
+        else:
+            self.generation = snapshot['generation']
+            offset = snapshot['offset']
+            self.day = snapshot['day']
+            for guild_id, days in snapshot['buckets'].items():
+                for day, grants in days.items():
+                    for user_id, amount in grants.items():
+                        self.apply(int(day) * DAY, int(guild_id), int(user_id), amount)
+
+        try:
+            self.file = open(self.path, 'r+b')
+        except FileNotFoundError:
+            self.file = self.create_journal(self.path, self.generation)
+            return
+
+        magic, generation = HEADER.unpack(self.file.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError('%s is not an XP journal' % self.path)
+        if generation < self.generation:
+            # Compaction finished the snapshot but not the journal swap, the snapshot already has it all
+            self.file.close()
+            self.file = self.create_journal(self.path, self.generation)
+            return
+        if generation > self.generation:
+            offset = HEADER.size
+
+        self.file.seek(offset)
+        while True:
+            data = self.file.read(RECORD.size * 1024)
+            whole = len(data) - len(data) % RECORD.size
+            for record in RECORD.iter_unpack(data[:whole]):
+                self.apply(*record)
+            offset += whole
+            if len(data) < RECORD.size * 1024:
+                break
+        # Drop a record torn by a crash mid-write
+        self.file.truncate(offset)
+        self.file.seek(offset)
+
+    @staticmethod
+    def create_journal(path, generation):
+        f = open(path, 'w+b')
+        f.write(HEADER.pack(MAGIC, generation))
+        f.flush()
+        os.fsync(f.fileno())
+        return f
+
+    def advance(self, day):
+        """
+        Moves the windows forward to a new day, subtracting the days that fall out of them.
+
+        :param day: Day number (days since the epoch) to move to
+        :return:
+        """
+        if self.day is None:
+            self.day = day
+            return
+        if day <= self.day:
+            return
+
+        for name, length in self.windows.items():
+            if day - self.day >= length:
+                self.rankings[name] = {}
+                continue
+            for expired in range(self.day - length + 1, day - length + 1):
+                for guild_id, days in self.buckets.items():
+                    ranking = self.rankings[name].get(guild_id)
+                    for user_id, amount in days.get(expired, {}).items():
+                        self.subtract(ranking, user_id, amount)
+
+        oldest = day - max(self.windows.values())
+        for days in self.buckets.values():
+            for expired in [d for d in days if d <= oldest]:
+                del days[expired]
+        self.day = day
+
+    @staticmethod
+    def subtract(ranking, user_id, amount):
+        if ranking is None:
+            return
+        if ranking.score(str(user_id)) - amount <= 0:
+            ranking.remove(str(user_id))
+        else:
+            ranking.add(str(user_id), -amount)
+
+    def apply(self, timestamp, guild_id, user_id, amount):
+        day = int(timestamp // DAY)
+        self.advance(day)
+        if day <= self.day - max(self.windows.values()):
+            return
+
+        grants = self.buckets.setdefault(guild_id, {}).setdefault(day, {})
+        grants[user_id] = grants.get(user_id, 0) + amount
+        for name, length in self.windows.items():
+            if day > self.day - length:
+                self.rankings[name].setdefault(guild_id, leaderboard.Ranking()).add(str(user_id), amount)
+
+    def record(self, guild_id, user_id, amount, timestamp=None):
+        """
+        Journals an XP grant and adds it to the window totals.
+
+        :param guild_id: ID of the guild the XP was earned in, 0 for DMs
+        :param user_id: ID of the user who earned it
+        :param amount: Amount of experience
+        :param timestamp: Time of the grant, defaults to now
+        :return:
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self.file.write(RECORD.pack(timestamp, guild_id, user_id, amount))
+        self.dirty = True
+        self.apply(timestamp, guild_id, user_id, amount)
+
+    def ranking(self, guild_id, window):
+        """
+        :param guild_id: ID of the guild
+        :param window: Name of the window, eg. 'week'
+        :return: Ranking of XP earned in the guild during the window
+        """
+        self.advance(int(time.time() // DAY))
+        return self.rankings[window].get(guild_id, leaderboard.Ranking())
+
+    def sync(self):
+        if self.dirty:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.dirty = False
+
+    def flush(self):
+        self.sync()
+        if self.file.tell() >= self.compact_size:
+            self.compact()
+
+    def compact(self):
+        """
+        Writes the day buckets still inside a window to a snapshot and starts a new, empty journal.
+        The new journal is written first, then the snapshot, then the journal is swapped in,
+        so a crash at any point leaves a snapshot and journal that load() can combine.
+
+        :return:
+        """
+        self.sync()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        generation = self.generation + 1
+
+        fd, journal_path = tempfile.mkstemp(prefix='.xp-', suffix='.journal', dir=directory)
+        os.close(fd)
+        try:
+            new_file = self.create_journal(journal_path, generation)
+        except BaseException:
+            os.unlink(journal_path)
+            raise
+
+        snapshot = {'generation': generation, 'offset': HEADER.size, 'day': self.day,
+                    'buckets': {guild_id: days for guild_id, days in self.buckets.items() if days}}
+        fd, snapshot_path = tempfile.mkstemp(prefix='.xp-', suffix='.json', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(snapshot_path, self.snapshot_path)
+        except BaseException:
+            new_file.close()
+            os.unlink(journal_path)
+            if os.path.exists(snapshot_path):
+                os.unlink(snapshot_path)
+            raise
+
+        os.replace(journal_path, self.path)
+        self.file.close()
+        self.file = new_file
+        self.generation = generation
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # A failed flush leaves the journal dirty and uncompacted, so the next one retries it
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+
+    def start(self, loop):
+        if self.flush_task is None:
+            self.flush_task = loop.create_task(self.flush_periodically())
+
+    def stop(self):
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        self.flush()